@@ -0,0 +1,237 @@
+import asyncio
+import hashlib
+import inspect
+import pickle
+import time
+from dataclasses import dataclass
+from functools import update_wrapper
+from threading import Lock
+from types import CodeType
+from typing import Any, Callable, Dict, Tuple
+
+from fishsense_common.pipeline.status import Status
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    # Change the version to invalidate results when something the code depends on changes.
+    version: str = ""
+    # Parameters which do not change the result, e.g. a logger.
+    ignore: Tuple[str, ...] = ()
+
+
+def __update_with_code(digest: Any, code: CodeType):
+    digest.update(code.co_code)
+    digest.update(repr(code.co_names).encode())
+
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            __update_with_code(digest, const)
+        else:
+            digest.update(repr(const).encode())
+
+
+def code_fingerprint(function: Callable) -> str:
+    digest = hashlib.sha256()
+    digest.update(f"{function.__module__}.{function.__qualname__}".encode())
+
+    code = getattr(function, "__code__", None)
+    if code is not None:
+        __update_with_code(digest, code)
+
+    return digest.hexdigest()
+
+
+class TaskCache:
+    """
+    A content addressed store for @task(cache=...) results on an fsspec filesystem.
+    Results are keyed by the task's code and its input values, so changing a task only
+    invalidates that task and the tasks after it.  When max_size_bytes is set, the
+    least recently used results are evicted once the store grows past it.
+    """
+
+    def __init__(
+        self,
+        filesystem: Any = None,
+        root: str = None,
+        max_size_bytes: int = None,
+    ):
+        if filesystem is None:
+            from fsspec import filesystem as fsspec_filesystem
+
+            filesystem = fsspec_filesystem("file")
+
+        if root is None:
+            from platformdirs import user_cache_dir
+
+            cache_dir = user_cache_dir("PipelineCache", "Engineers for Exploration")
+            root = f"{cache_dir}/tasks"
+
+        self.__filesystem = filesystem
+        self.__root = root.rstrip("/")
+        self.__max_size_bytes = max_size_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.__lock = Lock()
+        self.__last_access: Dict[str, float] = {}
+        self.__size_bytes: int = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Locks cannot be pickled, e.g. when a pipeline is sent to a Ray worker.
+        state = self.__dict__.copy()
+        del state["_TaskCache__lock"]
+
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__dict__.update(state)
+        self.__lock = Lock()
+
+    def __path(self, key: str) -> str:
+        return f"{self.__root}/{key[:2]}/{key}.pkl"
+
+    def key(
+        self, fingerprint: str, policy: CachePolicy, arguments: Dict[str, Any]
+    ) -> str:
+        digest = hashlib.sha256()
+        digest.update(fingerprint.encode())
+        digest.update(policy.version.encode())
+
+        for name in sorted(arguments):
+            if name in policy.ignore:
+                continue
+
+            digest.update(name.encode())
+            digest.update(pickle.dumps(arguments[name], protocol=5))
+
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        path = self.__path(key)
+
+        try:
+            value = pickle.loads(self.__filesystem.cat_file(path))
+        except FileNotFoundError:
+            with self.__lock:
+                self.misses += 1
+
+            return False, None
+        except (pickle.UnpicklingError, EOFError):
+            # A partially written result, e.g. from a killed worker.
+            self.__filesystem.rm_file(path)
+
+            with self.__lock:
+                self.misses += 1
+
+            return False, None
+
+        with self.__lock:
+            self.hits += 1
+            self.__last_access[key] = time.time()
+
+        return True, value
+
+    def put(self, key: str, value: Any):
+        data = pickle.dumps(value, protocol=5)
+        path = self.__path(key)
+
+        self.__filesystem.makedirs(path.rsplit("/", 1)[0], exist_ok=True)
+        self.__filesystem.pipe_file(path, data)
+
+        with self.__lock:
+            self.__last_access[key] = time.time()
+
+            if self.__size_bytes is not None:
+                self.__size_bytes += len(data)
+
+        if self.__max_size_bytes is not None:
+            self.__evict()
+
+    def __evict(self):
+        with self.__lock:
+            if (
+                self.__size_bytes is not None
+                and self.__size_bytes <= self.__max_size_bytes
+            ):
+                return
+
+            # Other processes may share the store, so look at what is actually there.
+            entries: Dict[str, Tuple[int, float]] = {}
+            for path, info in self.__filesystem.find(self.__root, detail=True).items():
+                key = path.rsplit("/", 1)[-1].removesuffix(".pkl")
+                modified = info.get("mtime", info.get("LastModified", 0))
+                if not isinstance(modified, (int, float)):
+                    modified = modified.timestamp()
+
+                entries[path] = (
+                    info["size"],
+                    max(modified, self.__last_access.get(key, 0)),
+                )
+
+            self.__size_bytes = sum(size for size, _ in entries.values())
+
+            for path, (size, _) in sorted(entries.items(), key=lambda e: e[1][1]):
+                if self.__size_bytes <= self.__max_size_bytes:
+                    break
+
+                self.__filesystem.rm_file(path)
+                self.__size_bytes -= size
+                self.evictions += 1
+
+    def wrap(self, function: Callable, parameters: Tuple[str, ...]) -> Callable:
+        return _CachedTask(self, function, parameters)
+
+
+class _CachedTask:
+    def __init__(
+        self, cache: TaskCache, function: Callable, parameters: Tuple[str, ...]
+    ):
+        update_wrapper(self, function)
+
+        self.__cache = cache
+        self.__function = function
+        self.__parameters = parameters
+        self.__policy: CachePolicy = function.cache
+        self.__fingerprint = code_fingerprint(function)
+        self.__is_async = inspect.iscoroutinefunction(function)
+
+    def __key(self, args: Tuple[Any, ...]) -> str:
+        return self.__cache.key(
+            self.__fingerprint, self.__policy, dict(zip(self.__parameters, args))
+        )
+
+    async def __acall(self, *args: Any) -> Any:
+        key = self.__key(args)
+
+        # Keep the filesystem off the event loop.
+        found, result = await asyncio.to_thread(self.__cache.get, key)
+        if found:
+            return result
+
+        result = await self.__function(*args)
+
+        if not isinstance(result, Status) or result.status:
+            await asyncio.to_thread(self.__cache.put, key, result)
+
+        return result
+
+    def __call__(self, *args: Any) -> Any:
+        if self.__is_async:
+            return self.__acall(*args)
+
+        key = self.__key(args)
+
+        found, result = self.__cache.get(key)
+        if found:
+            return result
+
+        result = self.__function(*args)
+
+        # Failures are not cached, they are usually cheap and may be transient.
+        if not isinstance(result, Status) or result.status:
+            self.__cache.put(key, result)
+
+        return result
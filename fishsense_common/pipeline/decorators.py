@@ -1,10 +1,37 @@
 from typing import Callable, Tuple
 
+from fishsense_common.pipeline.cache import CachePolicy
 
-def task(output_name: str | Tuple[str, ...] = None):
+
+def task(
+    output_name: str | Tuple[str, ...] = None,
+    returns_status: bool = None,
+    batched: bool = False,
+    cache: bool | CachePolicy = None,
+    vram_mb: int = None,
+    num_cpus: float = None,
+    memory_mb: int = None,
+):
     def wrapper(func: Callable):
         func.output_name = output_name
 
+        # None means unknown, the pipeline will check for a Status at runtime.
+        func.returns_status = returns_status
+
+        # Batched tasks receive a list (or stacked array) per parameter and return
+        # one value per item, which may individually be a Status.
+        func.batched = batched
+
+        # Results are only cached when the pipeline is given a TaskCache.
+        func.cache = CachePolicy() if cache is True else cache or None
+
+        # Only used when the pipeline is run as a RayPipeline.
+        func.resources = {
+            "vram_mb": vram_mb,
+            "num_cpus": num_cpus,
+            "memory_mb": memory_mb,
+        }
+
         return func
 
     return wrapper
@@ -0,0 +1,322 @@
+import json
+import os
+import resource
+import time
+import tracemalloc
+from bisect import bisect_left
+from functools import update_wrapper
+from threading import Lock
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+from fishsense_common.pipeline.status import Status
+
+# Quarter decade buckets from a microsecond to about three hours.
+WALL_TIME_BUCKETS = tuple(10 ** (e / 4) for e in range(-24, 17))
+
+
+def read_rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # Not Linux, fall back to the peak which only ever grows.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class TaskStats:
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.max_rss_delta_bytes = 0
+        self.allocated_bytes = 0
+        self.wall_time_buckets: List[int] = [0] * (len(WALL_TIME_BUCKETS) + 1)
+
+    def merge(self, other: "TaskStats"):
+        self.calls += other.calls
+        self.failures += other.failures
+        self.wall_seconds += other.wall_seconds
+        self.cpu_seconds += other.cpu_seconds
+        self.max_rss_delta_bytes = max(
+            self.max_rss_delta_bytes, other.max_rss_delta_bytes
+        )
+        self.allocated_bytes += other.allocated_bytes
+        self.wall_time_buckets = [
+            a + b for a, b in zip(self.wall_time_buckets, other.wall_time_buckets)
+        ]
+
+    def percentile(self, q: float) -> float:
+        """
+        Returns the upper bound of the bucket holding the q-th percentile of wall time.
+        """
+        if self.calls == 0:
+            return 0.0
+
+        target = q / 100 * self.calls
+        count = 0
+        for bound, bucket in zip(WALL_TIME_BUCKETS, self.wall_time_buckets):
+            count += bucket
+            if count >= target:
+                return bound
+
+        return float("inf")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "wall_seconds": {
+                "total": self.wall_seconds,
+                "p50": self.percentile(50),
+                "p90": self.percentile(90),
+                "p99": self.percentile(99),
+            },
+            "cpu_seconds": self.cpu_seconds,
+            "max_rss_delta_bytes": self.max_rss_delta_bytes,
+            "allocated_bytes": self.allocated_bytes,
+        }
+
+
+class PipelineStats:
+    """
+    Collects per task call counts, failures, wall and CPU time and memory growth.  Pass
+    it to a pipeline to enable instrumentation, pipelines without one run the tasks
+    unwrapped.  Stats are picklable, so a Ray worker can return them (see drain) and
+    the driver can merge them.
+    """
+
+    def __init__(self, trace_allocations: bool = False):
+        self.__trace_allocations = trace_allocations
+        self.__lock = Lock()
+        self.tasks: Dict[str, TaskStats] = {}
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        del state["_PipelineStats__lock"]
+
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__dict__.update(state)
+        self.__lock = Lock()
+
+    @property
+    def trace_allocations(self) -> bool:
+        return self.__trace_allocations
+
+    def record(
+        self,
+        name: str,
+        wall_seconds: float,
+        cpu_seconds: float,
+        rss_delta_bytes: int,
+        allocated_bytes: int,
+        failed: bool,
+    ):
+        with self.__lock:
+            stats = self.tasks.get(name)
+            if stats is None:
+                stats = self.tasks[name] = TaskStats()
+
+            stats.calls += 1
+            stats.failures += failed
+            stats.wall_seconds += wall_seconds
+            stats.cpu_seconds += cpu_seconds
+            stats.max_rss_delta_bytes = max(stats.max_rss_delta_bytes, rss_delta_bytes)
+            stats.allocated_bytes += allocated_bytes
+            stats.wall_time_buckets[bisect_left(WALL_TIME_BUCKETS, wall_seconds)] += 1
+
+    def merge(self, other: "PipelineStats"):
+        with self.__lock:
+            for name, stats in other.tasks.items():
+                self.tasks.setdefault(name, TaskStats()).merge(stats)
+
+    def drain(self) -> "PipelineStats":
+        """
+        Returns the stats collected so far and starts over, so that the stats a worker
+        sends back with each of its results can be merged without counting twice.
+        """
+        drained = PipelineStats(self.__trace_allocations)
+
+        with self.__lock:
+            drained.tasks, self.tasks = self.tasks, {}
+
+        return drained
+
+    def wrap(self, function: Callable, generator: bool, is_async: bool) -> Callable:
+        if self.__trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+        return _InstrumentedTask(self, function, generator, is_async)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self.__lock:
+            return {name: stats.to_dict() for name, stats in self.tasks.items()}
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps({"tasks": self.to_dict()}, **kwargs)
+
+    def to_prometheus(self, prefix: str = "fishsense_pipeline_task") -> str:
+        lines: List[str] = []
+
+        with self.__lock:
+            tasks = list(self.tasks.items())
+
+        def add_metric(name: str, metric_type: str, help_text: str, attribute: str):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {metric_type}")
+            for task_name, stats in tasks:
+                lines.append(
+                    f'{prefix}_{name}{{task="{task_name}"}} {getattr(stats, attribute)}'
+                )
+
+        add_metric("calls_total", "counter", "Number of task calls.", "calls")
+        add_metric("failures_total", "counter", "Number of failed calls.", "failures")
+        add_metric("cpu_seconds_total", "counter", "CPU time in tasks.", "cpu_seconds")
+        add_metric(
+            "max_rss_delta_bytes",
+            "gauge",
+            "Largest resident memory growth during one call.",
+            "max_rss_delta_bytes",
+        )
+        add_metric(
+            "allocated_bytes_total",
+            "counter",
+            "Peak traced allocations summed over calls.",
+            "allocated_bytes",
+        )
+
+        lines.append(f"# HELP {prefix}_wall_seconds Wall time of task calls.")
+        lines.append(f"# TYPE {prefix}_wall_seconds histogram")
+        for task_name, stats in tasks:
+            count = 0
+            for bound, bucket in zip(WALL_TIME_BUCKETS, stats.wall_time_buckets):
+                count += bucket
+                lines.append(
+                    f'{prefix}_wall_seconds_bucket{{task="{task_name}",le="{bound:.6g}"}} {count}'
+                )
+            lines.append(
+                f'{prefix}_wall_seconds_bucket{{task="{task_name}",le="+Inf"}} {stats.calls}'
+            )
+            lines.append(
+                f'{prefix}_wall_seconds_sum{{task="{task_name}"}} {stats.wall_seconds}'
+            )
+            lines.append(
+                f'{prefix}_wall_seconds_count{{task="{task_name}"}} {stats.calls}'
+            )
+
+        return "\n".join(lines) + "\n"
+
+
+class _InstrumentedTask:
+    def __init__(
+        self,
+        stats: PipelineStats,
+        function: Callable,
+        generator: bool,
+        is_async: bool,
+    ):
+        update_wrapper(self, function)
+
+        self.__stats = stats
+        self.__function = function
+        self.__name: str = function.__name__
+        self.__generator = generator
+        self.__is_async = is_async
+
+    def __start(self) -> Tuple[float, float, int, int]:
+        allocated_before = 0
+        if self.__stats.trace_allocations:
+            allocated_before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+
+        return (
+            time.perf_counter(),
+            time.thread_time(),
+            read_rss_bytes(),
+            allocated_before,
+        )
+
+    def __stop(
+        self, start: Tuple[float, float, int, int]
+    ) -> Tuple[float, float, int, int]:
+        wall_start, cpu_start, rss_before, allocated_before = start
+
+        return (
+            time.perf_counter() - wall_start,
+            time.thread_time() - cpu_start,
+            max(read_rss_bytes() - rss_before, 0),
+            (
+                max(tracemalloc.get_traced_memory()[1] - allocated_before, 0)
+                if self.__stats.trace_allocations
+                else 0
+            ),
+        )
+
+    def __iterate(self, iterator: Iterator[Any]) -> Iterator[Any]:
+        # Only the time spent producing results belongs to the task, not the time the
+        # consumer holds on to each of them.
+        wall_seconds, cpu_seconds, rss_delta_bytes, allocated_bytes = 0.0, 0.0, 0, 0
+        failed = True
+
+        try:
+            while True:
+                start = self.__start()
+                try:
+                    value = next(iterator)
+                except StopIteration:
+                    failed = False
+                    return
+                finally:
+                    wall, cpu, rss_delta, allocated = self.__stop(start)
+                    wall_seconds += wall
+                    cpu_seconds += cpu
+                    rss_delta_bytes = max(rss_delta_bytes, rss_delta)
+                    allocated_bytes += allocated
+
+                yield value
+        except GeneratorExit:
+            failed = False
+            raise
+        finally:
+            self.__stats.record(
+                self.__name,
+                wall_seconds,
+                cpu_seconds,
+                rss_delta_bytes,
+                allocated_bytes,
+                failed,
+            )
+
+    async def __acall(self, *args: Any) -> Any:
+        # Other coroutines share the thread while this one waits, so only the wall
+        # time can be attributed to the task.
+        wall_start = time.perf_counter()
+        failed = True
+        try:
+            result = await self.__function(*args)
+            failed = isinstance(result, Status) and not result.status
+
+            return result
+        finally:
+            self.__stats.record(
+                self.__name, time.perf_counter() - wall_start, 0.0, 0, 0, failed
+            )
+
+    def __call__(self, *args: Any) -> Any:
+        if self.__generator:
+            return self.__iterate(iter(self.__function(*args)))
+
+        if self.__is_async:
+            return self.__acall(*args)
+
+        start = self.__start()
+        failed = True
+        try:
+            result = self.__function(*args)
+            failed = isinstance(result, Status) and not result.status
+
+            return result
+        finally:
+            self.__stats.record(self.__name, *self.__stop(start), failed)
@@ -0,0 +1,47 @@
+import sys
+from dataclasses import dataclass
+from typing import Any, Dict, Set, Tuple
+
+from fishsense_common.pipeline.plan import CompiledTask
+
+
+@dataclass
+class LiveSetReport:
+    # The largest total size of the values a pipeline call held at once.
+    peak_bytes: int
+    # The names that were alive at the peak.
+    peak_names: Tuple[str, ...]
+    # The task after which the peak was reached.
+    peak_task: str
+
+
+def build_release_points(
+    plan: Tuple[CompiledTask, ...], return_names: Tuple[str, ...]
+) -> Tuple[Tuple[str, ...], ...]:
+    """
+    Returns, for every task in the plan, the names which no later task reads before
+    binding them again.  Their values can be dropped as soon as the task is done.
+    """
+    live: Set[str] = set(return_names)
+    release_points = []
+
+    for compiled_task in reversed(plan):
+        used = set(compiled_task.parameters) | set(compiled_task.outputs)
+        release_points.append(tuple(sorted(used - live)))
+
+        live = (live - set(compiled_task.outputs)) | set(compiled_task.parameters)
+
+    return tuple(reversed(release_points))
+
+
+def sizeof(value: Any) -> int:
+    # NumPy arrays and torch tensors know the size of their buffers.
+    nbytes = getattr(value, "nbytes", None)
+    if isinstance(nbytes, int):
+        return nbytes
+
+    return sys.getsizeof(value)
+
+
+def measure_live_set(kwargs: Dict[str, Any]) -> int:
+    return sum(sizeof(v) for v in kwargs.values())
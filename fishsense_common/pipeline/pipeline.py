@@ -1,47 +1,443 @@
-import inspect
-from typing import Any, Callable, List, Tuple
+import asyncio
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from itertools import islice, product, repeat
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Sequence,
+    Set,
+    Tuple,
+)
 
+from fishsense_common.pipeline.cache import TaskCache
+from fishsense_common.pipeline.instrumentation import PipelineStats
+from fishsense_common.pipeline.liveness import (
+    LiveSetReport,
+    build_release_points,
+    measure_live_set,
+)
+from fishsense_common.pipeline.plan import (
+    CompiledTask,
+    Failure,
+    build_dependencies,
+    build_parameter_dependencies,
+    compile_task,
+    failure_value,
+    project,
+    return_names,
+    take,
+)
 from fishsense_common.pipeline.status import Status
 
 
+async def _gather(coroutines: List[Any]) -> List[Any]:
+    return await asyncio.gather(*coroutines)
+
+
 class Pipeline:
-    def __init__(self, *tasks: List[Callable], return_name: str | Tuple[str] = None):
-        self.__tasks = tasks
+    def __init__(
+        self,
+        *tasks: List[Callable],
+        return_name: str | Tuple[str] = None,
+        cache: TaskCache = None,
+        stats: PipelineStats = None,
+        parallel: bool = False,
+        max_workers: int = None,
+        track_live_set: bool = False,
+    ):
         self.__return_name = return_name
+        self.__stats = stats
+        self.__parallel = parallel
+        self.__max_workers = max_workers
 
-    def __call__(self, **kwargs) -> Tuple[str, Any]:
-        for task in self.__tasks:
-            output_name: str | Tuple[str, ...] = getattr(task, "output_name", None)
-
-            task_signature = inspect.signature(task)
-            task_parameters = task_signature.parameters
-            status = task(*(kwargs[param] for param in task_parameters))
-
-            if isinstance(status, Status):
-                if not status.status:
-                    if self.__return_name is not None:
-                        if isinstance(self.__return_name, str):
-                            return status.return_value, None
-                        else:
-                            return status.return_value, tuple(
-                                None for _ in self.__return_name
-                            )
-
-                    return status.return_value, None
-
-                results = status.return_value
+        # Resolve signatures and output bindings once instead of on every call.
+        self.__plan: Tuple[CompiledTask, ...] = tuple(
+            compile_task(t, cache, stats) for t in tasks
+        )
+        self.__failure_value = failure_value(return_name)
+        self.__return_names = return_names(return_name)
+
+        # Intermediate values are dropped after the last task which reads them.
+        self.__release_points = build_release_points(self.__plan, self.__return_names)
+        self.__steps = tuple(
+            (t.function, t.parameters, t, release)
+            for t, release in zip(self.__plan, self.__release_points)
+        )
+
+        self.__track_live_set = track_live_set
+        self.__live_set_report: LiveSetReport = None
+
+        self.__dependencies = build_dependencies(self.__plan)
+        self.__dependents: Tuple[Tuple[int, ...], ...] = tuple(
+            tuple(j for j, d in enumerate(self.__dependencies) if i in d)
+            for i in range(len(self.__plan))
+        )
+        self.__has_async_tasks = any(t.is_async for t in self.__plan)
+        self.__executor = self.__create_executor()
+
+    @property
+    def stats(self) -> PipelineStats | None:
+        return self.__stats
+
+    @property
+    def live_set_report(self) -> LiveSetReport | None:
+        """
+        The peak live set of the most recent sequential call when track_live_set is set.
+        """
+        return self.__live_set_report
+
+    def __create_executor(self) -> ThreadPoolExecutor | None:
+        if not self.__parallel:
+            return None
+
+        # Threads are only started on the first submit.
+        return ThreadPoolExecutor(
+            max_workers=self.__max_workers, thread_name_prefix="Pipeline"
+        )
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Executors cannot be pickled, e.g. when a pipeline is sent to a Ray worker.
+        state = self.__dict__.copy()
+        state["_Pipeline__executor"] = None
+
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__dict__.update(state)
+        self.__executor = self.__create_executor()
+
+    def __call_sequential(self, kwargs: dict) -> Tuple[str, Any]:
+        track_live_set = self.__track_live_set
+        if track_live_set:
+            report = LiveSetReport(measure_live_set(kwargs), tuple(kwargs), None)
+
+        for function, parameters, compiled_task, release in self.__steps:
+            succeeded, value = compiled_task.unwrap(
+                function(*[kwargs[param] for param in parameters])
+            )
+            if not succeeded:
+                return value, self.__failure_value
+
+            compiled_task.bind(kwargs, value)
+
+            if track_live_set:
+                live_bytes = measure_live_set(kwargs)
+                if live_bytes > report.peak_bytes:
+                    report = LiveSetReport(live_bytes, tuple(kwargs), function.__name__)
+                self.__live_set_report = report
+
+            for name in release:
+                del kwargs[name]
+
+        return project(self.__return_name, kwargs)
+
+    def __complete(
+        self,
+        index: int,
+        result: Any,
+        kwargs: dict,
+        remaining: List[Set[int]],
+        ready: List[int],
+    ) -> Failure | None:
+        compiled_task = self.__plan[index]
+
+        succeeded, value = compiled_task.unwrap(result)
+        if not succeeded:
+            return Failure(value)
+
+        compiled_task.bind(kwargs, value)
+
+        for dependent in self.__dependents[index]:
+            remaining[dependent].discard(index)
+            if not remaining[dependent]:
+                ready.append(dependent)
+
+        return None
+
+    def __call_parallel(self, kwargs: dict) -> Tuple[str, Any]:
+        remaining = [set(d) for d in self.__dependencies]
+        ready = [i for i, d in enumerate(remaining) if not d]
+        running: Dict[Future, int] = {}
+
+        try:
+            while ready or running:
+                for index in ready:
+                    compiled_task = self.__plan[index]
+                    future = self.__executor.submit(
+                        compiled_task.function,
+                        *[kwargs[param] for param in compiled_task.parameters],
+                    )
+                    running[future] = index
+                ready = []
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+                # Handle completions in task order so that the earliest failure wins.
+                for future in sorted(done, key=running.__getitem__):
+                    failed = self.__complete(
+                        running.pop(future), future.result(), kwargs, remaining, ready
+                    )
+                    if failed is not None:
+                        return failed.return_value, self.__failure_value
+
+                ready.sort()
+        finally:
+            # Anything that has not started yet is downstream of a failure.
+            for future in running:
+                future.cancel()
+
+        return project(self.__return_name, kwargs)
+
+    def __run_batched(
+        self, compiled_task: CompiledTask, arguments: List[Sequence[Any]], size: int
+    ) -> Tuple[List[Sequence[Any]], Dict[int, Any]]:
+        result = compiled_task.batch_function(*arguments)
+
+        if isinstance(result, Status):
+            if not result.status:
+                return [], {p: result.return_value for p in range(size)}
+
+            result = result.return_value
+
+        if result is None and not compiled_task.outputs:
+            return [], {}
+
+        columns = [result] if compiled_task.output_names is None else list(result)
+        failures: Dict[int, Any] = {}
+
+        for index, column in enumerate(columns):
+            if len(column) != size:
+                raise ValueError(
+                    f"Batched task {compiled_task.function.__name__} returned "
+                    f"{len(column)} values for {size} items."
+                )
+
+            # Stacked arrays cannot hold a Status, so only lists need unwrapping.
+            if hasattr(column, "shape"):
+                continue
+
+            column = list(column)
+            for position, value in enumerate(column):
+                if isinstance(value, Status):
+                    if not value.status:
+                        failures.setdefault(position, value.return_value)
+                        column[position] = None
+                    else:
+                        column[position] = value.return_value
+            columns[index] = column
+
+        return columns, failures
+
+    def __run_looped(
+        self, compiled_task: CompiledTask, arguments: List[Sequence[Any]], size: int
+    ) -> Tuple[List[Sequence[Any]], Dict[int, Any]]:
+        results: List[Any] = [
+            compiled_task.function(*[a[position] for a in arguments])
+            for position in range(size)
+        ]
+        failures: Dict[int, Any] = {}
+
+        if compiled_task.is_async:
+            # One event loop for the whole stage, so that the items' awaits overlap.
+            results = asyncio.run(_gather(results))
+
+        for position, result in enumerate(results):
+            succeeded, value = compiled_task.unwrap(result)
+            if not succeeded:
+                failures[position] = value
+                value = None
+
+            results[position] = value
+
+        if compiled_task.output_names is None:
+            return [results], failures
+
+        columns = [[] for _ in compiled_task.output_names]
+        for position, result in enumerate(results):
+            for column, value in zip(
+                columns, repeat(None) if position in failures else result
+            ):
+                column.append(value)
+
+        return columns, failures
+
+    def batch(self, **columns: Sequence[Any]) -> List[Tuple[str, Any]]:
+        """
+        Runs the pipeline over many items at once.  Every keyword is a column with one
+        value per item.  Batched tasks are called once with whole columns, other tasks
+        are looped over the items.  Items which fail are dropped from later batches
+        and get the same result that calling the pipeline on them would return.
+        """
+        sizes = {len(c) for c in columns.values()}
+        if len(sizes) > 1:
+            raise ValueError("All columns passed to batch must have the same length.")
+
+        size = sizes.pop() if sizes else 0
+        results: List[Tuple[str, Any]] = [None] * size
+        indices = list(range(size))
+
+        for index, compiled_task in enumerate(self.__plan):
+            if not indices:
+                break
+
+            arguments = [columns[param] for param in compiled_task.parameters]
+
+            if compiled_task.batch_function is not None:
+                outputs, failures = self.__run_batched(
+                    compiled_task, arguments, len(indices)
+                )
             else:
-                results = status
-
-            if output_name:
-                if isinstance(output_name, str):
-                    kwargs[output_name] = results
-                else:
-                    for name, result in zip(output_name, results):
-                        kwargs[name] = result
-
-        if self.__return_name is not None:
-            if isinstance(self.__return_name, str):
-                return "SUCCESS", kwargs[self.__return_name]
+                outputs, failures = self.__run_looped(
+                    compiled_task, arguments, len(indices)
+                )
+
+            if outputs:
+                columns.update(zip(compiled_task.outputs, outputs))
+
+            for name in self.__release_points[index]:
+                columns.pop(name, None)
+
+            if failures:
+                for position, return_value in failures.items():
+                    results[indices[position]] = return_value, self.__failure_value
+
+                keep = [p for p in range(len(indices)) if p not in failures]
+                indices = [indices[p] for p in keep]
+                columns = {n: take(c, keep) for n, c in columns.items()}
+
+        for position, index in enumerate(indices):
+            results[index] = project(
+                self.__return_name,
+                {name: columns[name][position] for name in self.__return_names},
+            )
+
+        return results
+
+    def map(
+        self, inputs: Iterable[Dict[str, Any]], batch_size: int = 256
+    ) -> Iterator[Tuple[str, Any]]:
+        inputs = iter(inputs)
+
+        while chunk := list(islice(inputs, batch_size)):
+            yield from self.batch(
+                **{name: [item[name] for item in chunk] for name in chunk[0]}
+            )
+
+    def sweep(
+        self, base_kwargs: Dict[str, Any], grid: Dict[str, Sequence[Any]]
+    ) -> List[Tuple[Dict[str, Any], Tuple[str, Any]]]:
+        """
+        Runs the pipeline for every combination of the values in grid on top of
+        base_kwargs.  Each task only runs once per distinct combination of the grid
+        values its inputs depend on, so varying a parameter of the last task reruns only
+        the last task.  Returns every grid point with its result.
+        """
+        names = tuple(grid)
+        dependencies = build_parameter_dependencies(self.__plan, names)
+        # (task index, positions of the grid values it depends on) -> its outcome
+        outcomes: Dict[Tuple[int, Tuple[int, ...]], Tuple[bool, Any]] = {}
+        results: List[Tuple[Dict[str, Any], Tuple[str, Any]]] = []
+
+        for positions in product(*(range(len(grid[n])) for n in names)):
+            point = {n: grid[n][p] for n, p in zip(names, positions)}
+            position_of = dict(zip(names, positions))
+            kwargs = {**base_kwargs, **point}
+            result = None
+
+            for index, compiled_task in enumerate(self.__plan):
+                key = (index, tuple(position_of[n] for n in dependencies[index]))
+
+                outcome = outcomes.get(key)
+                if outcome is None:
+                    outcome = self.__run_once(compiled_task, kwargs)
+
+                    # Outcomes which depend on every grid value are never reused.
+                    if len(dependencies[index]) < len(names):
+                        outcomes[key] = outcome
+
+                succeeded, value = outcome
+                if not succeeded:
+                    result = value, self.__failure_value
+                    break
+
+                compiled_task.bind(kwargs, value)
             else:
-                return "SUCCESS", tuple(kwargs[name] for name in self.__return_name)
+                result = project(self.__return_name, kwargs)
+
+            results.append((point, result))
+
+        return results
+
+    def __run_once(
+        self, compiled_task: CompiledTask, kwargs: Dict[str, Any]
+    ) -> Tuple[bool, Any]:
+        result = compiled_task.function(
+            *[kwargs[param] for param in compiled_task.parameters]
+        )
+
+        if compiled_task.is_async:
+            result = asyncio.run(result)
+
+        return compiled_task.unwrap(result)
+
+    async def acall(self, **kwargs) -> Tuple[str, Any]:
+        """
+        Runs the pipeline on the running event loop.  Async tasks run concurrently as
+        soon as their inputs are ready and other tasks are run in an executor, so that
+        they do not block the loop.
+        """
+        loop = asyncio.get_running_loop()
+
+        remaining = [set(d) for d in self.__dependencies]
+        ready = [i for i, d in enumerate(remaining) if not d]
+        running: Dict[asyncio.Future, int] = {}
+
+        try:
+            while ready or running:
+                for index in ready:
+                    compiled_task = self.__plan[index]
+                    arguments = [kwargs[param] for param in compiled_task.parameters]
+
+                    if compiled_task.is_async:
+                        future = asyncio.ensure_future(
+                            compiled_task.function(*arguments)
+                        )
+                    else:
+                        # Without an executor of our own, the loop's default is used.
+                        future = loop.run_in_executor(
+                            self.__executor, compiled_task.function, *arguments
+                        )
+                    running[future] = index
+                ready = []
+
+                done, _ = await asyncio.wait(
+                    running, return_when=asyncio.FIRST_COMPLETED
+                )
+
+                # Handle completions in task order so that the earliest failure wins.
+                for future in sorted(done, key=running.__getitem__):
+                    failed = self.__complete(
+                        running.pop(future), future.result(), kwargs, remaining, ready
+                    )
+                    if failed is not None:
+                        return failed.return_value, self.__failure_value
+
+                ready.sort()
+        finally:
+            for future in running:
+                future.cancel()
+
+        return project(self.__return_name, kwargs)
+
+    def __call__(self, **kwargs) -> Tuple[str, Any]:
+        if self.__has_async_tasks:
+            return asyncio.run(self.acall(**kwargs))
+
+        if self.__executor is not None:
+            return self.__call_parallel(kwargs)
+
+        return self.__call_sequential(kwargs)
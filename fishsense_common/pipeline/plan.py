@@ -0,0 +1,247 @@
+import inspect
+from functools import update_wrapper
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    List,
+    NamedTuple,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+from fishsense_common.pipeline.cache import TaskCache
+from fishsense_common.pipeline.instrumentation import PipelineStats
+from fishsense_common.pipeline.status import Status
+
+
+class CompiledTask(NamedTuple):
+    function: Callable
+    parameters: Tuple[str, ...]
+    # Exactly one of output_name and output_names is set when the task has outputs.
+    output_name: str | None
+    output_names: Tuple[str, ...] | None
+    returns_status: bool | None
+    # The original function of a @task(batched=True) task, which takes whole columns.
+    batch_function: Callable | None
+    # Generator tasks yield any number of results for every call.
+    generator: bool
+    # Coroutine functions, defined with async def.
+    is_async: bool
+    # The vram_mb, num_cpus and memory_mb a task asked for in @task.
+    resources: Dict[str, Any]
+
+    @property
+    def outputs(self) -> Tuple[str, ...]:
+        if self.output_name is not None:
+            return (self.output_name,)
+
+        return self.output_names or ()
+
+    def unwrap(self, result: Any) -> Tuple[bool, Any]:
+        """
+        Returns whether the task succeeded, and its return value or error.
+        """
+        if self.returns_status or (
+            self.returns_status is None and isinstance(result, Status)
+        ):
+            return result.status, result.return_value
+
+        return True, result
+
+    def bind(self, kwargs: Dict[str, Any], value: Any):
+        if self.output_name is not None:
+            kwargs[self.output_name] = value
+        elif self.output_names is not None:
+            kwargs.update(zip(self.output_names, value))
+
+
+class Failure:
+    """
+    Takes the place of an item whose task failed, when the item is passed on rather
+    than returned, e.g. between the stages of a streaming or Ray pipeline.
+    """
+
+    def __init__(self, return_value: Any):
+        self.return_value = return_value
+
+
+def __returns_status(task: Callable) -> bool | None:
+    returns_status = getattr(task, "returns_status", None)
+    if returns_status is not None:
+        return returns_status
+
+    return_annotation = inspect.signature(task).return_annotation
+    if return_annotation is Status or return_annotation == "Status":
+        return True
+
+    # We cannot tell, so the pipeline has to check the result at runtime.
+    return None
+
+
+class _SingleItem:
+    # Pipelines are pickled to be sent to Ray workers, which a closure could not be.
+    def __init__(self, batch_function: Callable, is_tuple: bool, has_outputs: bool):
+        update_wrapper(self, batch_function)
+
+        self.__batch_function = batch_function
+        self.__is_tuple = is_tuple
+        self.__has_outputs = has_outputs
+
+    def __call__(self, *args: Any) -> Any:
+        result = self.__batch_function(*[[arg] for arg in args])
+
+        if isinstance(result, Status):
+            if not result.status:
+                return result
+
+            result = result.return_value
+
+        # Sinks, e.g. writing a batch to disk, may return nothing at all.
+        if result is None and not self.__has_outputs:
+            return None
+
+        if not self.__is_tuple:
+            return result[0]
+
+        values = tuple(column[0] for column in result)
+        for value in values:
+            if isinstance(value, Status) and not value.status:
+                return value
+
+        return tuple(v.return_value if isinstance(v, Status) else v for v in values)
+
+
+def compile_task(
+    task: Callable, cache: TaskCache = None, stats: PipelineStats = None
+) -> CompiledTask:
+    output_name: str | Tuple[str, ...] = getattr(task, "output_name", None)
+    is_tuple = bool(output_name) and not isinstance(output_name, str)
+    batched: bool = getattr(task, "batched", False)
+    generator = inspect.isgeneratorfunction(task)
+    is_async = inspect.iscoroutinefunction(task)
+    parameters = tuple(inspect.signature(task).parameters)
+
+    if batched and is_async:
+        raise ValueError(f"Batched task {task.__name__} cannot be async.")
+
+    function = task
+    if cache is not None and getattr(task, "cache", None) and not generator:
+        function = cache.wrap(task, parameters)
+
+    if stats is not None:
+        function = stats.wrap(function, generator, is_async)
+
+    return CompiledTask(
+        # Batched tasks are called with columns of length one outside of Pipeline.batch.
+        function=(
+            _SingleItem(function, is_tuple, bool(output_name)) if batched else function
+        ),
+        parameters=parameters,
+        output_name=(
+            output_name if output_name and isinstance(output_name, str) else None
+        ),
+        output_names=tuple(output_name) if is_tuple else None,
+        returns_status=None if batched else __returns_status(task),
+        batch_function=function if batched else None,
+        generator=generator,
+        is_async=is_async,
+        resources=getattr(task, "resources", None) or {},
+    )
+
+
+def failure_value(return_name: str | Tuple[str, ...] | None) -> Tuple[None, ...] | None:
+    if return_name is not None and not isinstance(return_name, str):
+        return tuple(None for _ in return_name)
+
+    return None
+
+
+def return_names(return_name: str | Tuple[str, ...] | None) -> Tuple[str, ...]:
+    if return_name is None:
+        return ()
+
+    if isinstance(return_name, str):
+        return (return_name,)
+
+    return tuple(return_name)
+
+
+def project(
+    return_name: str | Tuple[str, ...] | None, kwargs: Dict[str, Any]
+) -> Tuple[str, Any]:
+    if return_name is None:
+        return None
+
+    if isinstance(return_name, str):
+        return "SUCCESS", kwargs[return_name]
+
+    return "SUCCESS", tuple(kwargs[name] for name in return_name)
+
+
+def build_dependencies(plan: Tuple[CompiledTask, ...]) -> Tuple[FrozenSet[int], ...]:
+    """
+    Returns, for every task in the plan, the indices of the earlier tasks it has to wait for.
+    A task waits for the producers of its parameters and, so that a name which is bound
+    twice keeps its sequential meaning, for the earlier readers and writers of its outputs.
+    """
+    last_writer: Dict[str, int] = {}
+    readers: Dict[str, List[int]] = {}
+    dependencies: List[FrozenSet[int]] = []
+
+    for index, compiled_task in enumerate(plan):
+        depends_on: Set[int] = set()
+
+        for parameter in compiled_task.parameters:
+            if parameter in last_writer:
+                depends_on.add(last_writer[parameter])
+
+        for name in compiled_task.outputs:
+            if name in last_writer:
+                depends_on.add(last_writer[name])
+
+            depends_on.update(readers.get(name, ()))
+
+        depends_on.discard(index)
+        dependencies.append(frozenset(depends_on))
+
+        for parameter in compiled_task.parameters:
+            readers.setdefault(parameter, []).append(index)
+
+        for name in compiled_task.outputs:
+            last_writer[name] = index
+            readers[name] = []
+
+    return tuple(dependencies)
+
+
+def take(column: Sequence[Any], positions: List[int]) -> Sequence[Any]:
+    # NumPy arrays and torch tensors support selecting rows with a list of positions.
+    if hasattr(column, "shape"):
+        return column[positions]
+
+    return [column[p] for p in positions]
+
+
+def build_parameter_dependencies(
+    plan: Tuple[CompiledTask, ...], names: Tuple[str, ...]
+) -> Tuple[Tuple[str, ...], ...]:
+    """
+    Returns, for every task in the plan, which of the given input names its parameters
+    depend on, directly or through the outputs of earlier tasks.
+    """
+    influences: Dict[str, FrozenSet[str]] = {n: frozenset((n,)) for n in names}
+    dependencies: List[Tuple[str, ...]] = []
+
+    for compiled_task in plan:
+        depends_on = frozenset().union(
+            *(influences.get(p, frozenset()) for p in compiled_task.parameters)
+        )
+        dependencies.append(tuple(n for n in names if n in depends_on))
+
+        for name in compiled_task.outputs:
+            influences[name] = depends_on
+
+    return tuple(dependencies)
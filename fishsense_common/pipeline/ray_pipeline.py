@@ -0,0 +1,205 @@
+import asyncio
+from typing import Any, Callable, Dict, List, Tuple
+
+import ray
+
+from fishsense_common.pipeline.cache import TaskCache
+from fishsense_common.pipeline.instrumentation import PipelineStats
+from fishsense_common.pipeline.plan import (
+    CompiledTask,
+    Failure,
+    compile_task,
+    failure_value,
+    project,
+    return_names,
+)
+from fishsense_common.ray.decorators import get_num_gpus
+
+
+def _run_stage(
+    compiled_task: CompiledTask,
+    stats: PipelineStats | None,
+    failure: Failure | None,
+    *arguments: Any,
+) -> Tuple[Any, ...]:
+    output_count = len(compiled_task.outputs)
+
+    # Stages are chained on the status of the one before, so after a failure the
+    # remaining tasks are not called, like in Pipeline.
+    if failure is None:
+        result = compiled_task.function(*arguments)
+
+        if compiled_task.is_async:
+            result = asyncio.run(result)
+
+        succeeded, result = compiled_task.unwrap(result)
+        if not succeeded:
+            failure = Failure(result)
+
+    if failure is not None:
+        outputs = (failure,) * output_count
+    elif compiled_task.output_name is not None:
+        outputs = (result,)
+    else:
+        outputs = tuple(result) if output_count else ()
+
+    # Then the status of the stage, None when every stage so far succeeded, and what
+    # the worker recorded since its last stage.
+    return (*outputs, failure, stats.drain() if stats is not None else None)
+
+
+def _collect(
+    return_name: str | Tuple[str, ...] | None,
+    stage_count: int,
+    failure: Failure | None,
+    *values: Any,
+) -> Tuple[Tuple[str, Any], PipelineStats | None]:
+    stats: PipelineStats = None
+    for stage_stats in values[:stage_count]:
+        if stats is None:
+            stats = stage_stats
+        elif stage_stats is not None:
+            stats.merge(stage_stats)
+
+    if failure is not None:
+        return (failure.return_value, failure_value(return_name)), stats
+
+    result = project(
+        return_name, dict(zip(return_names(return_name), values[stage_count:]))
+    )
+
+    return result, stats
+
+
+class RayPipeline:
+    """
+    Runs every task of a pipeline as its own Ray task.  Intermediate values are passed
+    between the tasks as ObjectRefs and never go through the driver, and each task only
+    holds the resources it declared with @task(vram_mb=..., num_cpus=..., memory_mb=...).
+
+    Like Pipeline, no task runs after one failed, so the stages of a call run one after
+    another while different calls overlap.  A stage downstream of a failure is still
+    scheduled, and briefly holds its resources, to pass the failure on.  Stats
+    recorded on the workers are merged into stats as the calls finish.
+    """
+
+    def __init__(
+        self,
+        *tasks: List[Callable],
+        return_name: str | Tuple[str] = None,
+        cache: TaskCache = None,
+        stats: PipelineStats = None,
+    ):
+        self.__return_name = return_name
+        self.__return_names = return_names(return_name)
+        self.__stats = stats
+        # The stats of calls submitted with remote which were not merged yet.
+        self.__pending_stats: List[ray.ObjectRef] = []
+
+        # Stages record into a copy on the workers which starts out empty, so that
+        # what the driver recorded before is not merged back twice.
+        self.__worker_stats = (
+            PipelineStats(stats.trace_allocations) if stats is not None else None
+        )
+        self.__plan: Tuple[CompiledTask, ...] = tuple(
+            compile_task(t, cache, self.__worker_stats) for t in tasks
+        )
+
+        for compiled_task in self.__plan:
+            if compiled_task.generator:
+                raise ValueError(
+                    f"Generator task {compiled_task.function.__name__} cannot run in a "
+                    "RayPipeline, use a StreamingPipeline instead."
+                )
+
+        # Created on first use, so that constructing a pipeline does not probe the GPUs.
+        self.__stages: List[ray.remote_function.RemoteFunction] = None
+        self.__collect = ray.remote(num_cpus=0, num_returns=2)(_collect)
+
+    @property
+    def stats(self) -> PipelineStats | None:
+        self.__merge_stats()
+
+        return self.__stats
+
+    def __merge_stats(self):
+        if not self.__pending_stats:
+            return
+
+        ready, self.__pending_stats = ray.wait(
+            self.__pending_stats,
+            num_returns=len(self.__pending_stats),
+            timeout=0,
+        )
+
+        for stats in ray.get(ready):
+            if stats is not None:
+                self.__stats.merge(stats)
+
+    def __create_stage(
+        self, compiled_task: CompiledTask
+    ) -> ray.remote_function.RemoteFunction:
+        resources = compiled_task.resources
+        options: Dict[str, Any] = {"num_returns": len(compiled_task.outputs) + 2}
+
+        num_gpus = get_num_gpus(resources.get("vram_mb"))
+        if num_gpus is not None:
+            options["num_gpus"] = num_gpus
+
+        if resources.get("num_cpus") is not None:
+            options["num_cpus"] = resources["num_cpus"]
+
+        if resources.get("memory_mb") is not None:
+            options["memory"] = int(resources["memory_mb"] * 1024**2)
+
+        stats = self.__worker_stats
+
+        def stage(*arguments: Any) -> Any:
+            return _run_stage(compiled_task, stats, *arguments)
+
+        stage.__name__ = stage.__qualname__ = compiled_task.function.__name__
+
+        return ray.remote(**options)(stage)
+
+    def remote(self, **kwargs) -> ray.ObjectRef:
+        """
+        Submits the pipeline and returns a reference to what calling it would return.
+        """
+        if self.__stages is None:
+            self.__stages = [self.__create_stage(t) for t in self.__plan]
+
+        references: Dict[str, Any] = {
+            name: ray.put(value) for name, value in kwargs.items()
+        }
+        failure: ray.ObjectRef | None = None
+        stage_stats: List[ray.ObjectRef] = []
+
+        for compiled_task, stage in zip(self.__plan, self.__stages):
+            *outputs, failure, stats = stage.remote(
+                failure, *[references[param] for param in compiled_task.parameters]
+            )
+
+            references.update(zip(compiled_task.outputs, outputs))
+            stage_stats.append(stats)
+
+        result, stats = self.__collect.remote(
+            self.__return_name,
+            len(stage_stats),
+            failure,
+            *stage_stats,
+            *[references[name] for name in self.__return_names],
+        )
+
+        if self.__stats is not None:
+            self.__merge_stats()
+            self.__pending_stats.append(stats)
+
+        return result
+
+    def __call__(self, **kwargs) -> Tuple[str, Any]:
+        result = ray.get(self.remote(**kwargs))
+
+        # The stats of this call are ready along with its result.
+        self.__merge_stats()
+
+        return result
@@ -0,0 +1,194 @@
+import asyncio
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+
+from fishsense_common.pipeline.cache import TaskCache
+from fishsense_common.pipeline.instrumentation import PipelineStats
+from fishsense_common.pipeline.liveness import build_release_points
+from fishsense_common.pipeline.plan import (
+    CompiledTask,
+    Failure,
+    compile_task,
+    failure_value,
+    project,
+    return_names,
+)
+
+
+class _Raised:
+    def __init__(self, exception: BaseException):
+        self.exception = exception
+
+
+_END = object()
+
+
+class StreamingPipeline:
+    """
+    Runs every task of a pipeline as its own stage, connected to the next stage by a
+    bounded queue.  Stages overlap in time and a full queue blocks the stage in front
+    of it, so only a few items are in memory at once.  Generator tasks may yield any
+    number of results for a single item, e.g. one per frame of a video.
+    """
+
+    def __init__(
+        self,
+        *tasks: List[Callable],
+        return_name: str | Tuple[str] = None,
+        cache: TaskCache = None,
+        stats: PipelineStats = None,
+        queue_size: int = 8,
+    ):
+        self.__return_name = return_name
+        self.__stats = stats
+        self.__queue_size = queue_size
+
+        self.__plan: Tuple[CompiledTask, ...] = tuple(
+            compile_task(t, cache, stats) for t in tasks
+        )
+        self.__failure_value = failure_value(return_name)
+
+        # Values are dropped from an item after the last stage which reads them.
+        self.__release_points = build_release_points(
+            self.__plan, return_names(return_name)
+        )
+
+    @property
+    def stats(self) -> PipelineStats | None:
+        return self.__stats
+
+    def __put(self, queue: Queue, item: Any, stop: Event) -> bool:
+        # Time out regularly so that a stage blocked on a full queue notices a stop.
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+
+        return False
+
+    def __get(self, queue: Queue, stop: Event) -> Any:
+        while not stop.is_set():
+            try:
+                return queue.get(timeout=0.1)
+            except Empty:
+                continue
+
+        return _END
+
+    def __feed(self, inputs: Iterable[Dict[str, Any]], sink: Queue, stop: Event):
+        try:
+            for kwargs in inputs:
+                if not self.__put(sink, dict(kwargs), stop):
+                    return
+        except BaseException as e:  # pylint: disable=broad-exception-caught
+            self.__put(sink, _Raised(e), stop)
+            return
+
+        self.__put(sink, _END, stop)
+
+    def __bind(
+        self,
+        compiled_task: CompiledTask,
+        release: Tuple[str, ...],
+        kwargs: Dict[str, Any],
+        result: Any,
+    ) -> Dict[str, Any] | Failure:
+        succeeded, value = compiled_task.unwrap(result)
+        if not succeeded:
+            return Failure(value)
+
+        compiled_task.bind(kwargs, value)
+
+        for name in release:
+            del kwargs[name]
+
+        return kwargs
+
+    def __stage(
+        self,
+        compiled_task: CompiledTask,
+        release: Tuple[str, ...],
+        source: Queue,
+        sink: Queue,
+        stop: Event,
+    ):
+        # Async tasks run on an event loop of the stage's own.
+        loop = asyncio.new_event_loop() if compiled_task.is_async else None
+
+        try:
+            while (kwargs := self.__get(source, stop)) is not _END:
+                if isinstance(kwargs, (Failure, _Raised)):
+                    if not self.__put(sink, kwargs, stop) or isinstance(
+                        kwargs, _Raised
+                    ):
+                        return
+
+                    continue
+
+                try:
+                    arguments = [kwargs[param] for param in compiled_task.parameters]
+
+                    if compiled_task.generator:
+                        for result in compiled_task.function(*arguments):
+                            # Every yielded result continues as its own item.
+                            item = self.__bind(
+                                compiled_task, release, dict(kwargs), result
+                            )
+                            if not self.__put(sink, item, stop):
+                                return
+                    else:
+                        result = compiled_task.function(*arguments)
+                        if loop is not None:
+                            result = loop.run_until_complete(result)
+
+                        item = self.__bind(compiled_task, release, kwargs, result)
+                        if not self.__put(sink, item, stop):
+                            return
+                except BaseException as e:  # pylint: disable=broad-exception-caught
+                    self.__put(sink, _Raised(e), stop)
+                    return
+        finally:
+            if loop is not None:
+                loop.close()
+
+        self.__put(sink, _END, stop)
+
+    def __call__(self, inputs: Iterable[Dict[str, Any]]) -> Iterator[Tuple[str, Any]]:
+        stop = Event()
+        queues = [Queue(self.__queue_size) for _ in range(len(self.__plan) + 1)]
+
+        threads = [Thread(target=self.__feed, args=(inputs, queues[0], stop))]
+        threads.extend(
+            Thread(
+                target=self.__stage,
+                args=(
+                    compiled_task,
+                    self.__release_points[i],
+                    queues[i],
+                    queues[i + 1],
+                    stop,
+                ),
+                name=f"StreamingPipeline-{compiled_task.function.__name__}",
+            )
+            for i, compiled_task in enumerate(self.__plan)
+        )
+
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        try:
+            while (item := queues[-1].get()) is not _END:
+                if isinstance(item, _Raised):
+                    raise item.exception
+
+                if isinstance(item, Failure):
+                    yield item.return_value, self.__failure_value
+                else:
+                    yield project(self.__return_name, item)
+        finally:
+            # Unblocks every stage when the consumer stops early or a stage raised.
+            stop.set()
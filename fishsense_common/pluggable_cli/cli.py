@@ -5,9 +5,6 @@ import sys
 from argparse import ArgumentParser
 from typing import Dict
 
-import yaml
-from wakepy import keep
-
 from fishsense_common.pluggable_cli.arguments import ARGUMENTS, Argument
 from fishsense_common.pluggable_cli.command import Command
 from fishsense_common.pluggable_cli.generate_ray_config_command import (
@@ -64,6 +61,8 @@ class Cli:
         config = {}
         if value is not None:
             if os.path.exists(value):
+                import yaml
+
                 with open(value, "r") as f:
                     config = yaml.safe_load(f)
             else:
@@ -171,6 +170,8 @@ class Cli:
         sleep_hold_set = False
         if self.__keep_awake:
             try:
+                from wakepy import keep
+
                 sleep_hold = keep.running()
                 sleep_hold.__enter__()
                 sleep_hold_set = True
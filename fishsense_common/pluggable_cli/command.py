@@ -6,16 +6,15 @@ from abc import abstractmethod
 from logging import Logger
 from multiprocessing import cpu_count
 from pathlib import Path
-from typing import Any, Iterable, Tuple
-
-import ray
-import yaml
-from platformdirs import user_config_dir
-from tqdm import tqdm
+from typing import TYPE_CHECKING, Any, Iterable, Tuple
 
 from fishsense_common import __version__
 from fishsense_common.pluggable_cli.arguments import ARGUMENTS, argument
 
+# Ray, yaml and tqdm are imported where they are used, so that the cli starts quickly.
+if TYPE_CHECKING:
+    import ray
+
 
 class Command:
     """
@@ -67,11 +66,6 @@ class Command:
         self.__max_num_cpu: int = None
         self.__max_num_gpu: int = None
 
-    def __to_iterator(self, futures: Iterable[ray.ObjectRef]) -> Iterable[Any]:
-        while futures:
-            done, futures = ray.wait(futures)
-            yield ray.get(done[0])
-
     def save_config(self, save_config: str):
         class_name = f"{self.__class__.__module__}.{self.__class__.__qualname__}"
         args = {
@@ -80,12 +74,18 @@ class Command:
             if k.startswith(class_name)
         }
 
+        import yaml
+
         config = {self.name: {"args": args}}
         with open(save_config, "w") as f:
             yaml.safe_dump(config, f)
 
     def init_ray(self) -> Tuple[int, int]:
-        import torch
+        import ray
+        import yaml
+        from platformdirs import user_config_dir
+
+        from fishsense_common.utils.hardware import get_inventory
 
         ray_config_path = (
             Path(user_config_dir("RayCli", "Engineers for Exploration", __version__))
@@ -102,8 +102,9 @@ class Command:
             ray_config["num_cpus"] = min(cpu_count(), self.__max_num_cpu or 0)
 
         if self.max_num_gpu is not None:
+            inventory = get_inventory()
             ray_config["num_gpus"] = min(
-                torch.cuda.device_count() if torch.cuda.is_available() else 1000,
+                inventory.gpu_count if inventory.cuda_available else 1000,
                 self.__max_num_gpu or 0,
             )
 
@@ -113,8 +114,12 @@ class Command:
             ray_config["num_gpus"] if "num_gpus" in ray_config else None
         )
 
-    def tqdm(self, futures: Iterable[ray.ObjectRef], **kwargs) -> Iterable[Any]:
-        return tqdm(self.__to_iterator(futures), **kwargs)
+    def tqdm(self, futures: Iterable["ray.ObjectRef"], **kwargs) -> Iterable[Any]:
+        from tqdm import tqdm
+
+        from fishsense_common.ray.completion import as_completed
+
+        return tqdm(as_completed(futures), **kwargs)
 
     @abstractmethod
     def __call__(self):
@@ -1,9 +1,6 @@
 from multiprocessing import cpu_count
 from pathlib import Path
 
-import yaml
-from platformdirs import user_config_dir
-
 from fishsense_common import __version__
 from fishsense_common.pluggable_cli.command import Command
 
@@ -22,11 +19,16 @@ class GenerateRayConfigCommand(Command):
         return "Generates a Ray config that can be used to customize the consumption of Ray commands."
 
     def __call__(self):
-        import torch # We want to avoid importing 
+        import yaml
+        from platformdirs import user_config_dir
+
+        from fishsense_common.utils.hardware import get_inventory
+
+        inventory = get_inventory()
 
         max_num_cpu = min(cpu_count(), self.max_num_cpu or 1000)
         max_num_gpu = min(
-            torch.cuda.device_count() if torch.cuda.is_available() else 1000,
+            inventory.gpu_count if inventory.cuda_available else 1000,
             self.max_num_gpu or 0,
         )
 
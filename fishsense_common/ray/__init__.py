@@ -1 +1 @@
-from fishsense_common.ray.decorators import remote
+from fishsense_common.ray.decorators import get_num_gpus, remote
@@ -0,0 +1,70 @@
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+import ray
+
+from fishsense_common.ray.chunking import run_chunk
+
+
+class _Worker:
+    def __init__(self, setup: Callable[[], Any], function: Callable):
+        # Whatever setup returns, e.g. a model on the device, is kept for every item.
+        self.__function = partial(function, setup())
+
+    def run(self, parameters: Iterable[Any]) -> Any:
+        return self.__function(*parameters)
+
+    def run_chunk(self, items_chunk: List[Iterable[Any]]) -> Tuple[List[Any], float]:
+        return run_chunk(self.__function, items_chunk)
+
+
+class ActorPool:
+    """
+    A pool of long-lived Ray actors.  Every actor calls setup once when it starts and
+    then runs function(state, *parameters) for each item it is sent, where state is
+    what setup returned.  Items go to the actor with the fewest outstanding items.
+    """
+
+    def __init__(
+        self, setup: Callable[[], Any], function: Callable, size: int, **options
+    ):
+        worker = ray.remote(**options)(_Worker)
+
+        self.__actors = [worker.remote(setup, function) for _ in range(size)]
+        self.__outstanding = [0] * size
+        self.__assigned: Dict[ray.ObjectRef, int] = {}
+
+    @property
+    def size(self) -> int:
+        return len(self.__actors)
+
+    def __least_busy(self) -> int:
+        index = min(range(len(self.__actors)), key=self.__outstanding.__getitem__)
+        self.__outstanding[index] += 1
+
+        return index
+
+    def submit(self, parameters: Iterable[Any]) -> ray.ObjectRef:
+        index = self.__least_busy()
+        future = self.__actors[index].run.remote(parameters)
+        self.__assigned[future] = index
+
+        return future
+
+    def submit_chunk(self, items_chunk: List[Iterable[Any]]) -> ray.ObjectRef:
+        index = self.__least_busy()
+        future = self.__actors[index].run_chunk.remote(items_chunk)
+        self.__assigned[future] = index
+
+        return future
+
+    def done(self, future: ray.ObjectRef):
+        self.__outstanding[self.__assigned.pop(future)] -= 1
+
+    def shutdown(self):
+        for actor in self.__actors:
+            ray.kill(actor)
+
+        self.__actors = []
+        self.__outstanding = []
+        self.__assigned = {}
@@ -0,0 +1,70 @@
+import time
+from itertools import islice
+from typing import Any, Callable, Iterable, Iterator, List, Tuple
+
+
+class ChunkSizer:
+    """
+    Decides how many items go into the next chunk.  A fixed chunk_size is used as is,
+    otherwise the size is tuned so that a chunk takes about target_seconds, which keeps
+    the per task overhead of Ray small without starving the workers.
+    """
+
+    def __init__(
+        self,
+        chunk_size: int = None,
+        target_seconds: float = 0.2,
+        max_chunk_size: int = None,
+        smoothing: float = 0.3,
+    ):
+        self.__fixed = chunk_size is not None
+        self.__chunk_size = chunk_size or 1
+        self.__target_seconds = target_seconds
+        self.__max_chunk_size = max_chunk_size
+        self.__smoothing = smoothing
+        self.__item_seconds: float = None
+
+    @property
+    def chunk_size(self) -> int:
+        return self.__chunk_size
+
+    def record(self, count: int, elapsed_seconds: float):
+        if self.__fixed or count == 0:
+            return
+
+        item_seconds = elapsed_seconds / count
+        if self.__item_seconds is None:
+            self.__item_seconds = item_seconds
+        else:
+            self.__item_seconds += self.__smoothing * (
+                item_seconds - self.__item_seconds
+            )
+
+        chunk_size = int(self.__target_seconds / max(self.__item_seconds, 1e-9))
+
+        # Grow gradually, a single fast chunk should not decide the rest of the job.
+        chunk_size = min(chunk_size, 2 * self.__chunk_size)
+        if self.__max_chunk_size is not None:
+            chunk_size = min(chunk_size, self.__max_chunk_size)
+
+        self.__chunk_size = max(chunk_size, 1)
+
+
+def chunk(items: Iterable[Any], sizer: ChunkSizer) -> Iterator[List[Any]]:
+    # The size is read again for every chunk, so it follows the sizer as it learns.
+    items = iter(items)
+    while True:
+        items_chunk = list(islice(items, sizer.chunk_size))
+        if not items_chunk:
+            return
+
+        yield items_chunk
+
+
+def run_chunk(
+    function: Callable, items_chunk: List[Iterable[Any]]
+) -> Tuple[List[Any], float]:
+    start = time.perf_counter()
+    results = [function(*parameters) for parameters in items_chunk]
+
+    return results, time.perf_counter() - start
@@ -0,0 +1,360 @@
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Set, Tuple
+
+import ray
+import ray.exceptions
+
+
+@dataclass(frozen=True)
+class StragglerPolicy:
+    # Cancel an attempt that runs longer than this.
+    timeout_seconds: float = None
+    # How many times an item that failed or timed out is submitted again.
+    max_retries: int = 0
+    # Once every item is submitted, duplicate the ones running longer than this
+    # percentile of the observed durations.  The first result wins.
+    speculate_percentile: float = None
+    # The number of durations to observe before speculating.
+    min_samples: int = 20
+
+
+class _Item:
+    __slots__ = ("index", "item", "futures", "retries", "speculated", "finished")
+
+    def __init__(self, index: int, item: Any):
+        self.index = index
+        self.item = item
+        self.futures: Set[ray.ObjectRef] = set()
+        self.retries = 0
+        self.speculated = False
+        self.finished = False
+
+
+class CompletionEngine:
+    """
+    Submits work to Ray and yields results as they complete.  Each ray.wait harvests
+    every result that is ready instead of a single one, and ready results are fetched
+    with one ray.get.  When max_in_flight is set, items are only pulled from the input
+    when there is room for them.  max_in_flight and slots may be callables, which are
+    read again whenever they are needed, e.g. for a share of the cluster that changes
+    as other jobs start and finish.
+
+    A StragglerPolicy adds timeouts, retries and speculative duplicates.  Ray does not
+    tell the driver when a task starts, so with slots, the number of attempts Ray runs
+    at once, attempts beyond them are taken to be queued in submission order and their
+    durations are measured from when a slot frees up.  Without slots, durations are
+    measured from submission.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int | Callable[[], int] = None,
+        ordered: bool = False,
+        timeout_seconds: float = 0.1,
+        max_num_returns: int = 1024,
+        stragglers: StragglerPolicy = None,
+        slots: int | Callable[[], int] = None,
+    ):
+        self.__max_in_flight = max_in_flight
+        self.__ordered = ordered
+        self.__timeout_seconds = timeout_seconds
+        self.__max_num_returns = max_num_returns
+        self.__stragglers = stragglers or StragglerPolicy()
+        self.__slots = slots
+
+    def run(
+        self,
+        submit: Callable[[Any], ray.ObjectRef],
+        items: Iterable[Any],
+        done: Callable[[ray.ObjectRef], None] = None,
+    ) -> Iterator[Any]:
+        """
+        Calls submit for every item and yields the results.  done, when given, is called
+        with every future as soon as it has completed or was cancelled.
+        """
+        for _, result in self.run_items(submit, items, done):
+            yield result
+
+    def run_items(
+        self,
+        submit: Callable[[Any], ray.ObjectRef],
+        items: Iterable[Any],
+        done: Callable[[ray.ObjectRef], None] = None,
+    ) -> Iterator[Tuple[Any, Any]]:
+        """
+        Like run, but yields every result together with the item it was submitted for.
+        """
+        return _Run(self.__stragglers, self.__slots, submit, done).iterate(
+            iter(items),
+            self.__max_in_flight,
+            self.__ordered,
+            self.__timeout_seconds,
+            self.__max_num_returns,
+        )
+
+
+def _as_callable(value: int | Callable[[], int] | None) -> Callable[[], int | None]:
+    return value if callable(value) else lambda: value
+
+
+class _Attempt:
+    __slots__ = ("entry", "started_at")
+
+    def __init__(self, entry: _Item):
+        self.entry = entry
+        # None while the attempt is taken to be queued in Ray.
+        self.started_at: float = None
+
+
+class _Run:
+    def __init__(
+        self,
+        policy: StragglerPolicy,
+        slots: int | Callable[[], int] | None,
+        submit: Callable[[Any], ray.ObjectRef],
+        done: Callable[[ray.ObjectRef], None],
+    ):
+        self.__policy = policy
+        self.__slots = _as_callable(slots)
+        self.__submit = submit
+        self.__done = done
+
+        self.__pending: List[ray.ObjectRef] = []
+        self.__attempts: Dict[ray.ObjectRef, _Attempt] = {}
+        # Attempts in submission order which are not taken to be running yet.  Ones
+        # that finished are dropped when they reach the front.
+        self.__queued: Deque[ray.ObjectRef] = deque()
+        self.__running = 0
+        # Recent durations, enough for a stable percentile without keeping them all.
+        self.__durations: Deque[float] = deque(maxlen=1024)
+
+    def __promote(self):
+        now = time.monotonic()
+        slots = self.__slots()
+
+        while self.__queued and (slots is None or self.__running < slots):
+            attempt = self.__attempts.get(self.__queued.popleft())
+            if attempt is None:
+                continue
+
+            attempt.started_at = now
+            self.__running += 1
+
+    def __start(self, entry: _Item):
+        future = self.__submit(entry.item)
+
+        entry.futures.add(future)
+        self.__pending.append(future)
+        self.__attempts[future] = _Attempt(entry)
+        self.__queued.append(future)
+
+        self.__promote()
+
+    def __finish(self, future: ray.ObjectRef) -> Tuple[_Item, float | None]:
+        attempt = self.__attempts.pop(future)
+        attempt.entry.futures.discard(future)
+
+        if attempt.started_at is not None:
+            self.__running -= 1
+
+        if self.__done is not None:
+            self.__done(future)
+
+        self.__promote()
+
+        return attempt.entry, attempt.started_at
+
+    def __cancel(self, future: ray.ObjectRef):
+        self.__pending.remove(future)
+        self.__finish(future)
+
+        try:
+            ray.cancel(future, force=True)
+        except ValueError:
+            # Actor tasks cannot be forced.
+            ray.cancel(future)
+
+    def __fail(self, entry: _Item, error: Exception):
+        # Another attempt may still succeed.
+        if entry.futures:
+            return
+
+        if entry.retries >= self.__policy.max_retries:
+            raise error
+
+        entry.retries += 1
+        self.__start(entry)
+
+    def __get(self, ready: List[ray.ObjectRef]) -> List[Tuple[bool, Any]]:
+        try:
+            return [(True, r) for r in ray.get(ready)]
+        except ray.exceptions.RayError:
+            pass
+
+        # Find out which of them failed.
+        results = []
+        for future in ready:
+            try:
+                results.append((True, ray.get(future)))
+            except ray.exceptions.RayError as e:
+                results.append((False, e))
+
+        return results
+
+    def __speculation_threshold(self, exhausted: bool) -> float:
+        if (
+            not exhausted
+            or self.__policy.speculate_percentile is None
+            or len(self.__durations) < self.__policy.min_samples
+        ):
+            return None
+
+        durations = sorted(self.__durations)
+        position = self.__policy.speculate_percentile / 100 * (len(durations) - 1)
+
+        return durations[min(int(position), len(durations) - 1)]
+
+    def __check_stragglers(self, exhausted: bool):
+        timeout_seconds = self.__policy.timeout_seconds
+        threshold = self.__speculation_threshold(exhausted)
+
+        if timeout_seconds is None and threshold is None:
+            return
+
+        now = time.monotonic()
+        timed_out: List[ray.ObjectRef] = []
+        slow: List[_Item] = []
+
+        for future in self.__pending:
+            attempt = self.__attempts[future]
+            if attempt.started_at is None:
+                continue
+
+            entry = attempt.entry
+            elapsed = now - attempt.started_at
+
+            if timeout_seconds is not None and elapsed > timeout_seconds:
+                timed_out.append(future)
+            elif (
+                threshold is not None
+                and not entry.speculated
+                and len(entry.futures) == 1
+                and elapsed > threshold
+            ):
+                slow.append(entry)
+
+        for future in timed_out:
+            entry = self.__attempts[future].entry
+            self.__cancel(future)
+            self.__fail(
+                entry,
+                TimeoutError(f"Task did not finish within {timeout_seconds} seconds."),
+            )
+
+        for entry in slow:
+            if entry.futures:
+                entry.speculated = True
+                self.__start(entry)
+
+    def iterate(
+        self,
+        items: Iterator[Any],
+        max_in_flight: int | Callable[[], int] | None,
+        ordered: bool,
+        timeout_seconds: float,
+        max_num_returns: int,
+    ) -> Iterator[Tuple[Any, Any]]:
+        exhausted = False
+        submitted = 0
+
+        # Only used in ordered mode, to put results back into submission order.
+        buffered: Dict[int, Tuple[Any, Any]] = {}
+        next_index = 0
+
+        num_returns = 1
+        get_max_in_flight = _as_callable(max_in_flight)
+
+        while True:
+            max_in_flight = get_max_in_flight()
+
+            while not exhausted and (
+                max_in_flight is None
+                or len(self.__pending) + len(buffered) < max_in_flight
+            ):
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+
+                self.__start(_Item(submitted, item))
+                submitted += 1
+
+            if not self.__pending:
+                return
+
+            # Wait for a batch of results, but not for long when fewer are ready.
+            ready, self.__pending = ray.wait(
+                self.__pending,
+                num_returns=min(num_returns, len(self.__pending)),
+                timeout=timeout_seconds,
+            )
+
+            if not ready:
+                num_returns = max(num_returns // 2, 1)
+                self.__check_stragglers(exhausted)
+                continue
+
+            if len(ready) >= num_returns:
+                num_returns = min(num_returns * 2, max_num_returns)
+            else:
+                num_returns = max(len(ready), 1)
+
+            now = time.monotonic()
+            ready_set = set(ready)
+            completed: List[Tuple[_Item, Any]] = []
+
+            for future, (succeeded, result) in zip(ready, self.__get(ready)):
+                entry, started_at = self.__finish(future)
+
+                # A duplicate which finished after the winner.
+                if entry.finished:
+                    continue
+
+                if not succeeded:
+                    self.__fail(entry, result)
+                    continue
+
+                entry.finished = True
+                if started_at is not None:
+                    self.__durations.append(now - started_at)
+
+                # Duplicates in this batch are no longer pending, they are dropped as
+                # the loop reaches them.
+                for duplicate in list(entry.futures):
+                    if duplicate not in ready_set:
+                        self.__cancel(duplicate)
+
+                completed.append((entry, result))
+
+            self.__check_stragglers(exhausted)
+
+            if not ordered:
+                for entry, result in completed:
+                    yield entry.item, result
+                continue
+
+            for entry, result in completed:
+                buffered[entry.index] = entry.item, result
+
+            while next_index in buffered:
+                yield buffered.pop(next_index)
+                next_index += 1
+
+
+def as_completed(
+    futures: Iterable[ray.ObjectRef], ordered: bool = False
+) -> Iterator[Any]:
+    return CompletionEngine(ordered=ordered).run(lambda f: f, futures)
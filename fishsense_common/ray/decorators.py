@@ -1,20 +1,33 @@
 import math
 
-import ray
+from fishsense_common.utils.hardware import get_inventory
 
 
-def remote(vram_mb: int):
-    import torch
+def get_num_gpus(vram_mb: int) -> float | None:
+    if vram_mb is None:
+        return None
 
-    if not torch.cuda.is_available():
-        return ray.remote
+    inventory = get_inventory()
+    if not inventory.cuda_available:
+        return None
 
-    available_vram_mb = (
-        float(torch.cuda.get_device_properties(0).total_memory) / 1024**2
-    )
+    available_vram_mb = inventory.gpus[0].total_memory_mb
     percent_of_available_vram = float(vram_mb) / available_vram_mb
 
+    # Ray only supports partial GPUs if we are requesting less than one.
     if percent_of_available_vram > 1:
         percent_of_available_vram = math.ceil(percent_of_available_vram)
 
-    return ray.remote(num_gpus=percent_of_available_vram)
+    return percent_of_available_vram
+
+
+def remote(vram_mb: int):
+    # Imported here, so that fishsense_common.ray can be imported without loading Ray.
+    import ray
+
+    num_gpus = get_num_gpus(vram_mb)
+
+    if num_gpus is None:
+        return ray.remote
+
+    return ray.remote(num_gpus=num_gpus)
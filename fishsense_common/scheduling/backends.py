@@ -0,0 +1,180 @@
+from abc import ABC, abstractmethod
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from functools import partial
+from multiprocessing import cpu_count, get_all_start_methods, get_context
+from threading import local
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+
+from fishsense_common.ray.chunking import ChunkSizer, chunk, run_chunk
+
+# Below this much work in total, starting workers costs more than it saves.
+SERIAL_MAX_SECONDS = 0.5
+# Below this much work in total, starting Ray costs more than a local pool saves.
+LOCAL_MAX_SECONDS = 60.0
+
+BACKENDS = ("serial", "threads", "processes", "ray")
+
+
+def select_backend(job_count: int, estimated_task_seconds: float | None) -> str:
+    # Without an estimate there is nothing to go on, so keep running on Ray.
+    if estimated_task_seconds is None:
+        return "ray"
+
+    total_seconds = job_count * estimated_task_seconds
+    if total_seconds < SERIAL_MAX_SECONDS:
+        return "serial"
+
+    if total_seconds < LOCAL_MAX_SECONDS:
+        return "processes"
+
+    return "ray"
+
+
+class Backend(ABC):
+    """
+    Runs a job's function over its prologue, yielding (parameters, result) pairs in the
+    order they complete.
+    """
+
+    @abstractmethod
+    def __call__(
+        self, parameters: Iterable[Iterable[Any]]
+    ) -> Iterator[Tuple[Iterable[Any], Any]]:
+        raise NotImplementedError
+
+
+class SerialBackend(Backend):
+    def __init__(self, function: Callable, setup: Callable[[], Any] = None):
+        self.__function = function
+        self.__setup = setup
+
+    def __call__(
+        self, parameters: Iterable[Iterable[Any]]
+    ) -> Iterator[Tuple[Iterable[Any], Any]]:
+        function = self.__function
+        if self.__setup is not None:
+            function = partial(function, self.__setup())
+
+        for p in parameters:
+            yield p, function(*p)
+
+
+# The state setup returned, for each worker thread or process.
+_worker = local()
+
+
+def _initialize(setup: Callable[[], Any]):
+    _worker.state = setup()
+
+
+def _run_chunk(
+    function: Callable, with_state: bool, items_chunk: List[Iterable[Any]]
+) -> Tuple[List[Any], float]:
+    if with_state:
+        function = partial(function, _worker.state)
+
+    return run_chunk(function, items_chunk)
+
+
+class ExecutorBackend(Backend):
+    """
+    Runs chunks of items on a local thread or process pool, for jobs too small to be
+    worth starting Ray for.  setup runs once in every worker.
+    """
+
+    def __init__(
+        self,
+        executor_type: Callable[..., Executor],
+        function: Callable,
+        setup: Callable[[], Any] = None,
+        max_workers: int = None,
+        max_in_flight: int = None,
+        sizer: ChunkSizer = None,
+    ):
+        self.__executor_type = executor_type
+        self.__function = function
+        self.__setup = setup
+        self.__max_workers = max_workers
+        self.__max_in_flight = max_in_flight
+        self.__sizer = sizer or ChunkSizer(1)
+
+    def __create_executor(self) -> Executor:
+        if self.__setup is None:
+            return self.__executor_type(self.__max_workers)
+
+        return self.__executor_type(
+            self.__max_workers, initializer=_initialize, initargs=(self.__setup,)
+        )
+
+    def __call__(
+        self, parameters: Iterable[Iterable[Any]]
+    ) -> Iterator[Tuple[Iterable[Any], Any]]:
+        executor = self.__create_executor()
+        max_in_flight = self.__max_in_flight or 2 * (self.__max_workers or cpu_count())
+
+        chunks = chunk(parameters, self.__sizer)
+        pending: Dict[Future, List[Iterable[Any]]] = {}
+        exhausted = False
+
+        try:
+            while True:
+                while not exhausted and len(pending) < max_in_flight:
+                    items_chunk = next(chunks, None)
+                    if items_chunk is None:
+                        exhausted = True
+                        break
+
+                    future = executor.submit(
+                        _run_chunk,
+                        self.__function,
+                        self.__setup is not None,
+                        items_chunk,
+                    )
+                    pending[future] = items_chunk
+
+                if not pending:
+                    return
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    items_chunk = pending.pop(future)
+                    results, elapsed_seconds = future.result()
+                    self.__sizer.record(len(results), elapsed_seconds)
+
+                    yield from zip(items_chunk, results)
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+
+def create_local_backend(
+    name: str,
+    function: Callable,
+    setup: Callable[[], Any] = None,
+    max_workers: int = None,
+    max_in_flight: int = None,
+    sizer: ChunkSizer = None,
+) -> Backend:
+    if name == "serial":
+        return SerialBackend(function, setup)
+
+    if name == "threads":
+        executor_type = ThreadPoolExecutor
+    elif name == "processes":
+        # Forking copies the locks held by the driver's other threads, such as those of
+        # progress bars and concurrent jobs, and a child may wait on them forever.
+        method = "forkserver" if "forkserver" in get_all_start_methods() else "spawn"
+        executor_type = partial(ProcessPoolExecutor, mp_context=get_context(method))
+    else:
+        raise ValueError(f"Unknown backend {name}, expected one of {BACKENDS}.")
+
+    return ExecutorBackend(
+        executor_type, function, setup, max_workers, max_in_flight, sizer
+    )
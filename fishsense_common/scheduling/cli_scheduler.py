@@ -1,21 +1,26 @@
-import json
+import heapq
+import sys
+import traceback
 from argparse import ArgumentParser, _SubParsersAction
+from concurrent.futures import Future
 from glob import glob
 from multiprocessing import cpu_count
 from pathlib import Path
-from typing import Any, Callable, Dict, List
-
-import ray
-import yaml
-from fsspec import filesystem
-from platformdirs import user_config_dir
-from tqdm import tqdm
+from queue import Queue
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, List, Set, Tuple
 
 from fishsense_common import __version__
+from fishsense_common.scheduling.filesystems import get_filesystem
 from fishsense_common.scheduling.job import Job
 from fishsense_common.scheduling.job_definition import JobDefinition
+from fishsense_common.scheduling.job_graph import build_job_graph
+from fishsense_common.scheduling.job_manifest import load_manifest
 from fishsense_common.scheduling.scheduler import Scheduler
 
+# Ray, fsspec, yaml and tqdm are imported by the commands which use them, so that
+# --help and list-jobs start quickly.
+
 
 class CliScheduler(Scheduler):
     def __init__(self, name: str = None, description: str = None):
@@ -47,6 +52,16 @@ class CliScheduler(Scheduler):
             help="The job definition to run.",
         )
 
+        subparser.add_argument(
+            "--max-concurrent-jobs",
+            "-j",
+            dest="max_concurrent_jobs",
+            default=1,
+            type=int,
+            help="Sets how many jobs may run at the same time on the shared Ray runtime. "
+            "Jobs start once the jobs they depend on have finished.",
+        )
+
     def __register_generate_ray_config(self, subparsers: _SubParsersAction):
         subparser: ArgumentParser = subparsers.add_parser(
             "generate-ray-config",
@@ -72,58 +87,334 @@ class CliScheduler(Scheduler):
             help="Sets the maximum number of GPU kernels allowed.",
         )
 
-    def __parse_filesystem(self, filesyste_definition: Dict[str, Any]) -> filesystem:
-        if filesyste_definition is None:
-            return filesystem("file")
+    def __load_job_file(self, path: Path) -> Tuple[Any, Any, Iterable[JobDefinition]]:
+        header, jobs = load_manifest(path)
+
+        # fsspec caches filesystems, so job files defining the same one share it.
+        input_filesystem = get_filesystem(header.get("input_filesystem"))
+        output_filesystem = get_filesystem(header.get("output_filesystem"))
+
+        return input_filesystem, output_filesystem, jobs
+
+    def __create_job(
+        self,
+        job_definition: JobDefinition,
+        input_filesystem: Any,
+        output_filesystem: Any,
+    ) -> Job:
+        if job_definition.job_name not in self.job_types:
+            raise ValueError(f"Job type {job_definition.job_name} not found.")
+
+        job_type = self.job_types[job_definition.job_name]
+        job = job_type(job_definition, input_filesystem, output_filesystem)
+
+        if not isinstance(job, Job):
+            raise ValueError(f"Job {job_definition.job_name} is not a Job.")
+
+        return job
+
+    def __job_runner(
+        self, concurrency: int
+    ) -> Callable[[JobDefinition, Any, Any], None]:
+        # Running jobs split the cluster by weight, and the split is redone whenever a
+        # job starts or finishes, so a job that outlives the others takes up the room
+        # they leave.
+        running_jobs: List[Job] = []
+        running_jobs_lock = Lock()
+
+        def rebalance():
+            total_weight = sum(j.job_definition.weight for j in running_jobs)
+
+            for running_job in running_jobs:
+                running_job.share = (
+                    min(running_job.job_definition.weight / total_weight, 1.0)
+                    if total_weight > 0
+                    else 1.0
+                )
+
+        # Every running job gets its own line for its progress bar.
+        positions: Queue[int] = Queue()
+        for i in range(concurrency):
+            positions.put(2 + i)
+
+        def run(job_definition: JobDefinition, input_filesystem, output_filesystem):
+            position = positions.get()
+            try:
+                job = self.__create_job(
+                    job_definition, input_filesystem, output_filesystem
+                )
+                job.progress_position = position
+
+                with running_jobs_lock:
+                    running_jobs.append(job)
+                    rebalance()
+
+                try:
+                    job()
+                finally:
+                    with running_jobs_lock:
+                        running_jobs.remove(job)
+                        rebalance()
+            finally:
+                positions.put(position)
+
+        return run
+
+    def __report_failure(
+        self,
+        job_definition: JobDefinition,
+        error: BaseException,
+        errors: Dict[str, BaseException],
+    ):
+        from tqdm import tqdm
+
+        # Report failures as they happen, but let the other jobs finish.
+        errors[job_definition.display_name] = error
+        tqdm.write(
+            f"Job {job_definition.display_name} failed:\n"
+            + "".join(
+                traceback.format_exception(type(error), error, error.__traceback__)
+            )
+        )
 
-        protocol = filesyste_definition.get("protocol", "file")
-        kwargs = filesyste_definition.get("kwargs", {})
+    def __raise_failures(
+        self, errors: Dict[str, BaseException], skipped: List[str], count: int
+    ):
+        from tqdm import tqdm
+
+        if skipped:
+            tqdm.write(f"Skipped {', '.join(skipped)} as jobs they depend on failed.")
+
+        if errors:
+            raise RuntimeError(
+                f"{len(errors)} of {count} jobs failed: {', '.join(errors)}."
+            ) from next(iter(errors.values()))
+
+    def __run_graph(
+        self,
+        jobs: List[Tuple[JobDefinition, Any, Any]],
+        max_concurrent_jobs: int,
+    ):
+        from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+        from tqdm import tqdm
+
+        dependencies = build_job_graph([j[0] for j in jobs])
+
+        dependents: List[List[int]] = [[] for _ in jobs]
+        for i, job_dependencies in enumerate(dependencies):
+            for dependency in job_dependencies:
+                dependents[dependency].append(i)
+        remaining = [len(d) for d in dependencies]
+
+        concurrency = max(min(max_concurrent_jobs, len(jobs)), 1)
+
+        run = self.__job_runner(concurrency)
+
+        # Ready jobs start by priority, then in the order they were loaded.
+        ready = [(-j[0].priority, i) for i, j in enumerate(jobs) if remaining[i] == 0]
+        heapq.heapify(ready)
+
+        errors: Dict[str, BaseException] = {}
+        skipped: List[str] = []
+
+        def skip_dependents(i: int):
+            for dependent in dependents[i]:
+                # Only the first failed dependency skips a job.
+                if remaining[dependent] >= 0:
+                    remaining[dependent] = -1
+                    skipped.append(jobs[dependent][0].display_name)
+                    progress.update()
+                    skip_dependents(dependent)
+
+        with (
+            ThreadPoolExecutor(concurrency) as executor,
+            tqdm(total=len(jobs), position=1, desc="Running job") as progress,
+        ):
+            running: Dict[Future, int] = {}
+
+            while ready or running:
+                while ready and len(running) < concurrency:
+                    _, i = heapq.heappop(ready)
+                    running[executor.submit(run, *jobs[i])] = i
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    i = running.pop(future)
+                    progress.update()
+
+                    error = future.exception()
+                    if error is None:
+                        for dependent in dependents[i]:
+                            remaining[dependent] -= 1
+                            if remaining[dependent] == 0:
+                                heapq.heappush(
+                                    ready, (-jobs[dependent][0].priority, dependent)
+                                )
+                        continue
+
+                    self.__report_failure(jobs[i][0], error, errors)
+                    skip_dependents(i)
+
+        self.__raise_failures(errors, skipped, len(jobs))
+
+    def __run_streamed(
+        self,
+        jobs: Iterable[Tuple[JobDefinition, Any, Any]],
+        max_concurrent_jobs: int,
+    ):
+        from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+        from tqdm import tqdm
+
+        run = self.__job_runner(max_concurrent_jobs)
+
+        # Whether each finished job succeeded, by display name.
+        finished: Dict[str, bool] = {}
+        # Streamed jobs may depend on jobs listed after them, so they wait here.
+        waiting: List[Tuple[JobDefinition, Any, Any]] = []
+        errors: Dict[str, BaseException] = {}
+        skipped: List[str] = []
+        count = 0
+
+        with (
+            ThreadPoolExecutor(max_concurrent_jobs) as executor,
+            tqdm(position=1, desc="Running job") as progress,
+        ):
+            running: Dict[Future, JobDefinition] = {}
+
+            def start(job: Tuple[JobDefinition, Any, Any]) -> bool:
+                job_definition = job[0]
+                if any(d not in finished for d in job_definition.depends_on):
+                    return False
+
+                if all(finished[d] for d in job_definition.depends_on):
+                    if len(running) >= max_concurrent_jobs:
+                        return False
+
+                    running[executor.submit(run, *job)] = job_definition
+                else:
+                    finished[job_definition.display_name] = False
+                    skipped.append(job_definition.display_name)
+                    progress.update()
+
+                return True
+
+            def start_waiting():
+                # A skipped job may free the jobs waiting on it.
+                while (job := next((j for j in waiting if start(j)), None)) is not None:
+                    waiting.remove(job)
+
+            jobs = iter(jobs)
+            while True:
+                # Jobs read earlier go first.
+                start_waiting()
+
+                while len(running) < max_concurrent_jobs:
+                    job = next(jobs, None)
+                    if job is None:
+                        break
+
+                    count += 1
+                    if not start(job):
+                        waiting.append(job)
+
+                start_waiting()
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    job_definition = running.pop(future)
+                    progress.update()
+
+                    error = future.exception()
+                    finished[job_definition.display_name] = error is None
+                    if error is not None:
+                        self.__report_failure(job_definition, error, errors)
+
+        if waiting:
+            raise ValueError(
+                f"{', '.join(j[0].display_name for j in waiting)} depend on jobs which "
+                "are not listed, or which form a cycle."
+            )
 
-        return filesystem(protocol, **kwargs)
+        self.__raise_failures(errors, skipped, count)
+
+    def __shutdown_ray(self):
+        # Ray can only be running if a job imported it.
+        ray = sys.modules.get("ray")
+        if ray is not None and ray.is_initialized():
+            ray.shutdown()
 
     def __run_jobs_command(self, args: Any):
+        from tqdm import tqdm
+
         job_definitions_path: List[Path] = [
             Path(f) for g in args.job_definition_globs for f in glob(g)
         ]
 
-        for path in tqdm(job_definitions_path, position=0, desc="Job files"):
-            func: Callable = None
-            if path.suffix == ".yaml" or path.suffix == ".yml":
-                func = yaml.safe_load
-            elif path.suffix == ".json":
-                func = json.load
-            else:
-                # Raise a not supported error for any other file type
-                raise ValueError(f"File type {path.suffix} not supported.")
-
-            with open(path, "r") as f:
-                job_dict = func(f)
+        # Every file is opened first, as jobs may depend on jobs of other files.  JSON
+        # Lines manifests are streamed, so only their headers are read here.
+        job_files = [self.__load_job_file(path) for path in job_definitions_path]
 
-            if "jobs" not in job_dict:
-                raise ValueError("No jobs found in job definition.")
+        has_dependencies = any(
+            j.depends_on
+            for _, _, job_definitions in job_files
+            if isinstance(job_definitions, list)
+            for j in job_definitions
+        )
 
-            input_filesystem = self.__parse_filesystem(
-                job_dict["input_filesystem"] if "input_filesystem" in job_dict else None
+        if args.max_concurrent_jobs > 1 or has_dependencies:
+            jobs = (
+                (j, input_filesystem, output_filesystem)
+                for input_filesystem, output_filesystem, job_definitions in job_files
+                for j in job_definitions
             )
-            output_filesystem = self.__parse_filesystem(
-                job_dict["output_filesystem"] if "output_filesystem" in job_dict else None
-            )
-            jobs = [JobDefinition(**j) for j in job_dict["jobs"]]
-
-            for job_definition in tqdm(jobs, position=1, desc="Running job"):
-                if job_definition.job_name not in self.job_types:
-                    raise ValueError(f"Job type {job_definition.job_name} not found.")
 
-                job_type = self.job_types[job_definition.job_name]
-                job = job_type(job_definition, input_filesystem, output_filesystem)
-
-                if not isinstance(job, Job):
-                    raise ValueError(f"Job {job_definition.job_name} is not a Job.")
+            try:
+                if has_dependencies:
+                    # The graph needs every job, so streamed manifests are read to the
+                    # end.
+                    jobs = list(jobs)
+                    if jobs:
+                        self.__run_graph(jobs, args.max_concurrent_jobs)
+                else:
+                    # Streamed manifests are read as jobs start.
+                    self.__run_streamed(jobs, args.max_concurrent_jobs)
+            finally:
+                self.__shutdown_ray()
+
+            return
+
+        completed: Set[str] = set()
+
+        for input_filesystem, output_filesystem, job_definitions in tqdm(
+            job_files, position=0, desc="Job files"
+        ):
+            for job_definition in tqdm(job_definitions, position=1, desc="Running job"):
+                # Only streamed jobs get here with dependencies, which must have run.
+                missing = [d for d in job_definition.depends_on if d not in completed]
+                if missing:
+                    raise ValueError(
+                        f"Job {job_definition.display_name} depends on "
+                        f"{', '.join(missing)}, which did not run before it.  List it "
+                        "after them, or run with --max-concurrent-jobs above 1 to "
+                        "schedule jobs by their dependencies."
+                    )
+
+                job = self.__create_job(
+                    job_definition, input_filesystem, output_filesystem
+                )
 
                 job()
 
-        if ray.is_initialized():
-            ray.shutdown()
+                completed.add(job_definition.display_name)
+
+        self.__shutdown_ray()
 
     def __list_jobs_command(self, args: Any):
         print("Registered Job Types:")
@@ -131,11 +422,16 @@ class CliScheduler(Scheduler):
             print(f"  - {job_type}")
 
     def __generate_ray_config_command(self, args: Any):
-        import torch  # We want to avoid importing
+        import yaml
+        from platformdirs import user_config_dir
+
+        from fishsense_common.utils.hardware import get_inventory
+
+        inventory = get_inventory()
 
         max_num_cpu = min(cpu_count(), args.max_num_cpu)
         max_num_gpu = min(
-            torch.cuda.device_count() if torch.cuda.is_available() else 1000,
+            inventory.gpu_count if inventory.cuda_available else 1000,
             args.max_num_gpu or 0,
         )
 
@@ -0,0 +1,187 @@
+import os
+import time
+from threading import Lock, Thread
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple
+
+if TYPE_CHECKING:
+    from fsspec import AbstractFileSystem
+
+CACHE_TYPES = ("blockcache", "simplecache", "filecache")
+
+# How often a process checks whether its caches grew past their limits.
+TRIM_INTERVAL_SECONDS = 10.0
+
+
+class FilesystemSpec:
+    """
+    What a job file says about a filesystem: an fsspec protocol and its kwargs, and
+    optionally a caching layer on top of it, e.g.
+
+        input_filesystem:
+          protocol: s3
+          kwargs: {anon: true}
+          cache:
+            type: blockcache
+            max_size_mb: 4096
+            kwargs: {cache_storage: /tmp/fishsense-cache}
+
+    max_size_mb bounds the cache on disk, the least recently used files are evicted
+    first.
+    """
+
+    def __init__(
+        self,
+        protocol: str = "file",
+        kwargs: Dict[str, Any] = None,
+        cache_type: str = None,
+        cache_kwargs: Dict[str, Any] = None,
+        max_cache_size_mb: float = None,
+    ):
+        if cache_type is not None and cache_type not in CACHE_TYPES:
+            raise ValueError(
+                f"Unknown cache type {cache_type}, expected one of {CACHE_TYPES}."
+            )
+
+        self.protocol = protocol
+        self.kwargs = kwargs or {}
+        self.cache_type = cache_type
+        self.cache_kwargs = cache_kwargs or {}
+        self.max_cache_size_mb = max_cache_size_mb
+
+    @staticmethod
+    def from_definition(definition: Dict[str, Any] | None) -> "FilesystemSpec":
+        if definition is None:
+            return FilesystemSpec()
+
+        cache = definition.get("cache")
+        if isinstance(cache, str):
+            cache = {"type": cache}
+        cache = cache or {}
+
+        return FilesystemSpec(
+            definition.get("protocol", "file"),
+            definition.get("kwargs", {}),
+            cache.get("type"),
+            cache.get("kwargs", {}),
+            cache.get("max_size_mb"),
+        )
+
+
+def trim_cache(storage: str, max_size_mb: float) -> int:
+    """
+    Removes the least recently used files in a cache directory until it holds at most
+    max_size_mb, and returns how many bytes were removed.  Sparse blockcache files count
+    at their full size.  fsspec treats a missing file as not cached, so it downloads it
+    again when it is next read.
+    """
+    entries: List[Tuple[float, int, str]] = []
+    try:
+        with os.scandir(storage) as it:
+            for entry in it:
+                # The metadata of blockcache and filecache.
+                if entry.name == "cache" or not entry.is_file():
+                    continue
+
+                stat = entry.stat()
+                entries.append(
+                    (max(stat.st_atime, stat.st_mtime), stat.st_size, entry.path)
+                )
+    except FileNotFoundError:
+        return 0
+
+    excess = sum(e[1] for e in entries) - int(max_size_mb * 1024**2)
+    removed = 0
+
+    for _, size, path in sorted(entries):
+        if removed >= excess:
+            break
+
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # Another process sharing the storage removed it first.
+            pass
+
+        removed += size
+
+    return removed
+
+
+class CacheTrimmer:
+    """
+    Keeps the cache storages of one process within their limits.  They are checked
+    every interval_seconds on a background thread, so reads never wait for it.
+    """
+
+    def __init__(self, interval_seconds: float = TRIM_INTERVAL_SECONDS):
+        self.__interval_seconds = interval_seconds
+        self.__limits: Dict[str, float] = {}
+        self.__lock = Lock()
+        self.__thread: Thread = None
+
+    def add(self, storage: str, max_size_mb: float):
+        with self.__lock:
+            # Filesystems sharing a storage keep it within the smallest of their limits.
+            self.__limits[storage] = min(
+                max_size_mb, self.__limits.get(storage, max_size_mb)
+            )
+
+            if self.__thread is None:
+                self.__thread = Thread(
+                    target=self.__run, name="cache-trimmer", daemon=True
+                )
+                self.__thread.start()
+
+    def trim(self) -> int:
+        """
+        Trims every storage now, and returns how many bytes were removed.
+        """
+        with self.__lock:
+            limits = list(self.__limits.items())
+
+        return sum(trim_cache(storage, max_size_mb) for storage, max_size_mb in limits)
+
+    def __run(self):
+        while True:
+            time.sleep(self.__interval_seconds)
+            self.trim()
+
+
+__trimmer = CacheTrimmer()
+
+
+def get_cache_trimmer() -> CacheTrimmer:
+    return __trimmer
+
+
+def create_filesystem(spec: FilesystemSpec) -> "AbstractFileSystem":
+    from fsspec import filesystem
+
+    if spec.cache_type is None:
+        return filesystem(spec.protocol, **spec.kwargs)
+
+    cache_kwargs = {
+        "target_protocol": spec.protocol,
+        "target_options": spec.kwargs,
+        **spec.cache_kwargs,
+    }
+
+    if spec.max_cache_size_mb is None:
+        return filesystem(spec.cache_type, **cache_kwargs)
+
+    from fishsense_common.scheduling.trimmed_caches import TRIMMED_CACHES
+
+    return TRIMMED_CACHES[spec.cache_type](
+        max_size_mb=spec.max_cache_size_mb, **cache_kwargs
+    )
+
+
+def get_filesystem(definition: Dict[str, Any] | None) -> "AbstractFileSystem":
+    """
+    Returns the fsspec filesystem a job file defines.  fsspec keeps one instance per
+    arguments and thread, so job files defining the same filesystem share it with its
+    connections, listings and caches.  It pickles as its arguments, so all tasks of a
+    Ray worker thread share the worker's instance too.  The filesystem is created now,
+    so a bad definition fails when the job file is loaded.
+    """
+    return create_filesystem(FilesystemSpec.from_definition(definition))
@@ -25,6 +25,11 @@ class Job(ABC):
         self.__job_definition = job_definition
         self.input_filesystem = input_filesystem
         self.output_filesystem = output_filesystem
+
+        # Set by the scheduler when jobs run concurrently, and updated as the jobs
+        # running alongside this one start and finish.
+        self.share: float = 1.0
+        self.progress_position: int = 2
         self.__fill_parameters()
 
     def __get_argument(self, class_object: type, member: str) -> Argument:
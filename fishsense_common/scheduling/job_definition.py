@@ -1,4 +1,4 @@
-from typing import Any, Dict
+from typing import Any, Dict, List
 
 
 class JobDefinition:
@@ -7,7 +7,20 @@ class JobDefinition:
         display_name: str,
         job_name: str,
         parameters: Dict[str, Any],
+        priority: float = 0,
+        weight: float = 1,
+        depends_on: List[str] | str = None,
     ):
         self.display_name = display_name
         self.job_name = job_name
         self.parameters = parameters
+        # Jobs with a higher priority start first.
+        self.priority = priority
+        # The share of the cluster a job gets relative to the jobs running with it.
+        self.weight = weight
+        # The display names of the jobs which must finish before this one starts.
+        if depends_on is None:
+            depends_on = []
+        elif isinstance(depends_on, str):
+            depends_on = [depends_on]
+        self.depends_on: List[str] = list(depends_on)
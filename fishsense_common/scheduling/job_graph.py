@@ -0,0 +1,65 @@
+from typing import Dict, List, Set
+
+from fishsense_common.scheduling.job_definition import JobDefinition
+
+
+def build_job_graph(job_definitions: List[JobDefinition]) -> List[Set[int]]:
+    """
+    Returns, for every job, the indices of the jobs it depends on.  Jobs refer to each
+    other by display name.  Raises a ValueError for unknown or ambiguous names and for
+    cycles.
+    """
+    indices: Dict[str, List[int]] = {}
+    for i, job_definition in enumerate(job_definitions):
+        indices.setdefault(job_definition.display_name, []).append(i)
+
+    dependencies: List[Set[int]] = []
+    for job_definition in job_definitions:
+        job_dependencies: Set[int] = set()
+
+        for name in job_definition.depends_on:
+            if name not in indices:
+                raise ValueError(
+                    f"Job {job_definition.display_name} depends on {name}, which does "
+                    "not exist."
+                )
+
+            if len(indices[name]) > 1:
+                raise ValueError(
+                    f"Job {job_definition.display_name} depends on {name}, which is the "
+                    "display name of more than one job."
+                )
+
+            job_dependencies.add(indices[name][0])
+
+        dependencies.append(job_dependencies)
+
+    __validate_acyclic(job_definitions, dependencies)
+
+    return dependencies
+
+
+def __validate_acyclic(
+    job_definitions: List[JobDefinition], dependencies: List[Set[int]]
+):
+    # Kahn's algorithm, whatever cannot be ordered is on or behind a cycle.
+    remaining = [len(d) for d in dependencies]
+    dependents: List[List[int]] = [[] for _ in dependencies]
+    for i, job_dependencies in enumerate(dependencies):
+        for dependency in job_dependencies:
+            dependents[dependency].append(i)
+
+    ready = [i for i, r in enumerate(remaining) if r == 0]
+    ordered = 0
+    while ready:
+        i = ready.pop()
+        ordered += 1
+
+        for dependent in dependents[i]:
+            remaining[dependent] -= 1
+            if remaining[dependent] == 0:
+                ready.append(dependent)
+
+    if ordered < len(dependencies):
+        names = [j.display_name for j, r in zip(job_definitions, remaining) if r > 0]
+        raise ValueError(f"Job dependencies form a cycle through {', '.join(names)}.")
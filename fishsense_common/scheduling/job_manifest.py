@@ -0,0 +1,119 @@
+import gzip
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, TextIO, Tuple
+
+from fishsense_common.scheduling.job_definition import JobDefinition
+
+HEADER_KEYS = ("input_filesystem", "output_filesystem")
+
+
+def __get_format(path: Path) -> Tuple[str, bool]:
+    suffixes = [s.lower() for s in path.suffixes]
+
+    compressed = suffixes[-1:] == [".gz"]
+    if compressed:
+        suffixes = suffixes[:-1]
+
+    suffix = suffixes[-1] if suffixes else ""
+    if suffix not in (".yaml", ".yml", ".json", ".jsonl"):
+        raise ValueError(f"File type {''.join(path.suffixes)} not supported.")
+
+    return suffix, compressed
+
+
+def __open(path: Path, compressed: bool) -> TextIO:
+    if compressed:
+        return gzip.open(path, "rt", encoding="utf-8")
+
+    return open(path, "r", encoding="utf-8")
+
+
+def __is_job(line: Dict[str, Any]) -> bool:
+    return "job_name" in line
+
+
+def __read_lines(path: Path, compressed: bool) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    with __open(path, compressed) as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+
+            try:
+                yield number, json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"{path}:{number} is not valid JSON: {e}") from e
+
+
+def __read_header(path: Path, compressed: bool) -> Tuple[Dict[str, Any], int]:
+    header: Dict[str, Any] = {}
+
+    for number, line in __read_lines(path, compressed):
+        if __is_job(line):
+            return header, number
+
+        unknown = [k for k in line if k not in HEADER_KEYS]
+        if unknown:
+            raise ValueError(
+                f"{path}:{number} is neither a job nor a header, unknown keys "
+                f"{', '.join(unknown)}."
+            )
+
+        header.update(line)
+
+    return header, None
+
+
+def __read_jobs(
+    path: Path, compressed: bool, first_job: int | None
+) -> Iterator[JobDefinition]:
+    if first_job is None:
+        return
+
+    for number, line in __read_lines(path, compressed):
+        if number < first_job:
+            continue
+
+        if not __is_job(line):
+            raise ValueError(f"{path}:{number} is a header after the first job.")
+
+        yield JobDefinition(**line)
+
+
+def load_manifest(path: Path) -> Tuple[Dict[str, Any], Iterable[JobDefinition]]:
+    """
+    Reads a job file, any of which may be gzip compressed, and returns its header, the
+    filesystem definitions, and its jobs.
+
+    YAML and JSON files hold one document with a jobs list, and are read whole with
+    their jobs sorted by priority.  JSON Lines manifests, for generated job sets too big
+    for that, start with header lines such as {"input_filesystem": {...}} followed by
+    one job per line.  Only the header is read here, the jobs are read lazily and run
+    in the order of the file.
+    """
+    suffix, compressed = __get_format(path)
+
+    if suffix == ".jsonl":
+        header, first_job = __read_header(path, compressed)
+
+        return header, __read_jobs(path, compressed, first_job)
+
+    with __open(path, compressed) as f:
+        if suffix == ".json":
+            job_dict = json.load(f)
+        else:
+            import yaml
+
+            # libyaml's loader is many times faster where PyYAML was built with it.
+            job_dict = yaml.load(
+                f, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+            )
+
+    if "jobs" not in job_dict:
+        raise ValueError("No jobs found in job definition.")
+
+    jobs = [JobDefinition(**j) for j in job_dict.pop("jobs")]
+
+    # sorted is stable, so jobs of the same priority keep the order of the file.
+    return job_dict, sorted(jobs, key=lambda j: -j.priority)
@@ -0,0 +1,82 @@
+import os
+import pickle
+import time
+from typing import Any, Dict, List, Tuple
+
+
+class Journal:
+    """
+    An append-only record of completed items on an fsspec filesystem.  Completions are
+    buffered and written as one segment file per flush, which works on object stores
+    that cannot append to a file.  Loading merges the segments into one.
+    """
+
+    def __init__(
+        self,
+        filesystem: Any,
+        path: str,
+        flush_items: int = 256,
+        flush_seconds: float = 5.0,
+    ):
+        self.__filesystem = filesystem
+        self.__path = path.rstrip("/")
+        self.__flush_items = flush_items
+        self.__flush_seconds = flush_seconds
+
+        self.__buffer: List[Tuple[str, Any]] = []
+        self.__last_flush = time.monotonic()
+
+    def __segment_path(self) -> str:
+        # Unique per process and flush, so concurrent writers never clobber each other.
+        return f"{self.__path}/{time.time_ns():020d}-{os.getpid()}.journal"
+
+    def __segments(self) -> List[str]:
+        if not self.__filesystem.exists(self.__path):
+            return []
+
+        return sorted(
+            p
+            for p in self.__filesystem.ls(self.__path, detail=False)
+            if p.endswith(".journal")
+        )
+
+    def load(self) -> Dict[str, Any]:
+        completed: Dict[str, Any] = {}
+        segments = self.__segments()
+
+        for segment in segments:
+            try:
+                completed.update(pickle.loads(self.__filesystem.cat_file(segment)))
+            except (pickle.UnpicklingError, EOFError):
+                # A segment that was cut short when the job died, its items run again.
+                continue
+
+        if len(segments) > 1:
+            self.__write(list(completed.items()))
+
+            for segment in segments:
+                self.__filesystem.rm_file(segment)
+
+        return completed
+
+    def __write(self, entries: List[Tuple[str, Any]]):
+        self.__filesystem.makedirs(self.__path, exist_ok=True)
+        self.__filesystem.pipe_file(
+            self.__segment_path(), pickle.dumps(entries, protocol=5)
+        )
+
+    def record(self, key: str, result: Any):
+        self.__buffer.append((key, result))
+
+        if (
+            len(self.__buffer) >= self.__flush_items
+            or time.monotonic() - self.__last_flush >= self.__flush_seconds
+        ):
+            self.flush()
+
+    def flush(self):
+        if self.__buffer:
+            self.__write(self.__buffer)
+            self.__buffer = []
+
+        self.__last_flush = time.monotonic()
@@ -1,23 +1,37 @@
 import inspect
-import math
 import os
 import sys
 from abc import ABC, abstractmethod
+from collections import deque
 from multiprocessing import cpu_count
 from pathlib import Path
-from typing import Any, Callable, Iterable, List, Tuple
-
-import ray
-import ray.remote_function
-import yaml
-from platformdirs import user_config_dir
-from tqdm import tqdm
+from threading import Lock
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, Iterable, List, Tuple
 
 from fishsense_common import __version__
+from fishsense_common.ray.chunking import ChunkSizer, chunk, run_chunk
+from fishsense_common.ray.decorators import get_num_gpus
 from fishsense_common.scheduling.arguments import argument
+from fishsense_common.scheduling.backends import (
+    BACKENDS,
+    create_local_backend,
+    select_backend,
+)
 from fishsense_common.scheduling.job import Job
 from fishsense_common.scheduling.job_definition import JobDefinition
-from fishsense_common.utils.cuda import is_available as cuda_is_available
+from fishsense_common.scheduling.journal import Journal
+from fishsense_common.scheduling.result_sink import ResultSink
+from fishsense_common.utils.hardware import get_inventory
+
+# Ray, yaml and tqdm are imported where they are used, so that the cli starts quickly
+# and jobs on a local backend never load Ray.
+if TYPE_CHECKING:
+    import ray
+    import ray.remote_function
+
+    from fishsense_common.ray.completion import CompletionEngine
+
+_ray_init_lock = Lock()
 
 
 class RayJob(Job, ABC):
@@ -44,6 +58,124 @@ class RayJob(Job, ABC):
     def max_num_gpu(self, value: int):
         self.__max_num_gpu = value
 
+    @property
+    @argument(
+        "max-in-flight",
+        help="Sets the maximum number of tasks submitted to Ray at once.  Defaults to "
+        "twice the number of CPUs in the cluster.",
+    )
+    def max_in_flight(self) -> int:
+        return self.__max_in_flight
+
+    @max_in_flight.setter
+    def max_in_flight(self, value: int):
+        self.__max_in_flight = value
+
+    @property
+    @argument(
+        "chunk-size",
+        help="Sets the number of items run by each Ray task.  0 tunes it from the "
+        "measured task durations.  Defaults to 1.",
+    )
+    def chunk_size(self) -> int:
+        return self.__chunk_size
+
+    @chunk_size.setter
+    def chunk_size(self, value: int):
+        self.__chunk_size = value
+
+    @property
+    @argument(
+        "task-timeout",
+        help="Sets the number of seconds after which a task is cancelled and retried. "
+        "Time spent queued behind tasks filling the cluster does not count.",
+    )
+    def task_timeout(self) -> float:
+        return self.__task_timeout
+
+    @task_timeout.setter
+    def task_timeout(self, value: float):
+        self.__task_timeout = value
+
+    @property
+    @argument(
+        "max-retries",
+        help="Sets how many times a task that failed or timed out is retried.  "
+        "Defaults to 0.",
+    )
+    def max_retries(self) -> int:
+        return self.__max_retries
+
+    @max_retries.setter
+    def max_retries(self, value: int):
+        self.__max_retries = value
+
+    @property
+    @argument(
+        "speculate-percentile",
+        help="Once every item is submitted, runs a duplicate of tasks slower than this "
+        "percentile of task durations.  The first result wins.",
+    )
+    def speculate_percentile(self) -> float:
+        return self.__speculate_percentile
+
+    @speculate_percentile.setter
+    def speculate_percentile(self, value: float):
+        self.__speculate_percentile = value
+
+    @property
+    @argument(
+        "checkpoint",
+        help="Sets the path of a journal on the output filesystem.  Items which item_key "
+        "names and which completed before are skipped and their results are replayed.",
+    )
+    def checkpoint(self) -> str:
+        return self.__checkpoint
+
+    @checkpoint.setter
+    def checkpoint(self, value: str):
+        self.__checkpoint = value
+
+    @property
+    @argument(
+        "max-pending-writes",
+        help="Sets how many writes to result_sink may be queued before the epilogue "
+        "waits for them.  Defaults to 256.",
+    )
+    def max_pending_writes(self) -> int:
+        return self.__max_pending_writes
+
+    @max_pending_writes.setter
+    def max_pending_writes(self, value: int):
+        self.__max_pending_writes = value
+
+    @property
+    @argument(
+        "backend",
+        help="Sets where tasks run, one of serial, threads, processes or ray.  Defaults "
+        "to picking one from job_count and estimated_task_seconds.",
+    )
+    def backend(self) -> str:
+        return self.__backend
+
+    @backend.setter
+    def backend(self, value: str):
+        self.__backend = value
+
+    @property
+    def estimated_task_seconds(self) -> float | None:
+        """
+        Override with a rough cost per item, so that small jobs can skip starting Ray.
+        """
+        return None
+
+    @property
+    def result_sink(self) -> ResultSink:
+        """
+        Writes to output_filesystem in the background while epilogue runs.
+        """
+        return self.__result_sink
+
     @property
     def __debugger_attached(self) -> bool:
         for frame in inspect.stack():
@@ -61,43 +193,247 @@ class RayJob(Job, ABC):
         output_filesystem: Any,
         function: Callable,
         vram_mb: int = None,
+        setup: Callable[[], Any] = None,
     ):
         super().__init__(job_definition, input_filesystem, output_filesystem)
 
-        if not cuda_is_available():
-            vram_mb = None
+        num_gpus = get_num_gpus(vram_mb)
+
+        self.__run_chunk: "ray.remote_function.RemoteFunction" = None
+        self.__result_sink: ResultSink = None
+
+        # With a setup hook, items run on long-lived actors as function(state, *item).
+        self.__setup = setup
+        self.__num_gpus = num_gpus
+        self.__use_actors = setup is not None and not self.__debugger_attached
+
+        # Chunks and local backends run the plain function, with the same resources
+        # as a single item.  A function passed in already wrapped can only run on Ray.
+        self.__plain_function = None if hasattr(function, "remote") else function
+        self.__remote_options: Dict[str, Any] = {"num_gpus": num_gpus}
+
+        # Wrapped as a Ray remote function once Ray is chosen as the backend.
+        # The arguments were already filled in by Job.__init__, so don't reset them here.
+        self.__function: "ray.remote_function.RemoteFunction" = function
+
+    def __wrap_function(self):
+        import ray
+
+        # Actors wrap the function themselves.
+        if self.__setup is None and self.__plain_function is not None:
+            self.__function = ray.remote(**self.__remote_options)(self.__plain_function)
+
+    def __get_max_in_flight(self) -> Callable[[], int]:
+        import ray
+
+        if self.max_in_flight:
+            max_in_flight = self.max_in_flight
+            return lambda: max_in_flight
+
+        # Enough to keep every CPU busy while the driver harvests results, or this job's
+        # share of them when it runs alongside others.  The share changes as those jobs
+        # start and finish, so it is read on every refill.
+        num_cpus = int(ray.cluster_resources().get("CPU", cpu_count()))
+
+        return lambda: max(int(2 * num_cpus * self.share), 1)
+
+    def __get_slots(self) -> int:
+        # How many tasks run at once, the rest wait in Ray's queue.  Actors that the
+        # cluster cannot place would never start, so the pool stays within this too.
+        import ray
+
+        resources = ray.cluster_resources()
+
+        if self.__num_gpus:
+            num_gpus = resources.get("GPU", 0)
+            if self.max_num_gpu:
+                num_gpus = min(num_gpus, self.max_num_gpu)
+
+            return max(int(num_gpus / self.__num_gpus), 1)
+
+        num_cpus = int(resources.get("CPU", cpu_count()))
+        if self.max_num_cpu:
+            num_cpus = min(num_cpus, self.max_num_cpu)
+
+        return max(num_cpus, 1)
+
+    def __get_task_slots(self) -> Callable[[], int]:
+        slots = self.__get_slots()
+        if self.__use_actors:
+            return lambda: slots
 
-        num_gpus = None
-        if vram_mb is not None:
-            import torch
+        # Tasks of jobs running alongside this one take up the rest of the cluster.
+        # Erring low only lets a queued task's timeout start late.
+        return lambda: max(int(slots * self.share), 1)
 
-            available_vram_mb = (
-                float(torch.cuda.get_device_properties(0).total_memory) / 1024**2
+    def __to_iterator(
+        self, parameters: Iterable[Iterable[Any]]
+    ) -> Iterable[Tuple[Iterable[Any], Any]]:
+        from fishsense_common.ray.completion import CompletionEngine, StragglerPolicy
+
+        # Pull work from the prologue lazily, so that neither the driver nor Ray ever
+        # hold more than max_in_flight tasks.
+        max_in_flight = self.__get_max_in_flight()
+        engine = CompletionEngine(
+            max_in_flight=max_in_flight,
+            stragglers=StragglerPolicy(
+                timeout_seconds=self.task_timeout,
+                max_retries=self.max_retries or 0,
+                speculate_percentile=self.speculate_percentile,
+            ),
+            slots=self.__get_task_slots(),
+        )
+        chunked = self.chunk_size is not None and self.chunk_size != 1
+
+        if self.__use_actors:
+            return self.__run_on_actors(engine, max_in_flight(), parameters, chunked)
+
+        if not chunked:
+            return engine.run_items(lambda p: self.__function.remote(*p), parameters)
+
+        return self.__run_chunked(
+            engine, max_in_flight(), parameters, self.__submit_chunk()
+        )
+
+    def __run_on_actors(
+        self,
+        engine: "CompletionEngine",
+        max_in_flight: int,
+        parameters: Iterable[Iterable[Any]],
+        chunked: bool,
+    ) -> Iterable[Tuple[Iterable[Any], Any]]:
+        from fishsense_common.ray.actor_pool import ActorPool
+
+        actor_pool = ActorPool(
+            self.__setup,
+            self.__function,
+            self.__get_slots(),
+            num_cpus=1,
+            num_gpus=self.__num_gpus,
+        )
+
+        try:
+            if chunked:
+                yield from self.__run_chunked(
+                    engine,
+                    max_in_flight,
+                    parameters,
+                    actor_pool.submit_chunk,
+                    actor_pool.done,
+                )
+            else:
+                yield from engine.run_items(
+                    actor_pool.submit, parameters, actor_pool.done
+                )
+        finally:
+            actor_pool.shutdown()
+
+    def __submit_chunk(self) -> Callable[[List[Iterable[Any]]], "ray.ObjectRef"]:
+        import ray
+
+        if self.__plain_function is None:
+            raise ValueError(
+                "chunk-size needs the plain function, not a Ray remote function."
             )
-            percent_of_available_vram = float(vram_mb) / available_vram_mb
 
-            # Ray only supports partial GPUs if we are requesting less than one.
-            if percent_of_available_vram > 1:
-                percent_of_available_vram = math.ceil(percent_of_available_vram)
+        if self.__run_chunk is None:
+            # Chunks hold the same resources a single item would, they run one by one.
+            self.__run_chunk = ray.remote(**self.__remote_options)(run_chunk)
 
-            num_gpus = percent_of_available_vram
+        # Put the function in the object store once instead of pickling it per chunk.
+        function = ray.put(self.__plain_function)
 
-        if not hasattr(function, "remote") and not self.__debugger_attached:
-            function = ray.remote(num_gpus=num_gpus)(function)
+        return lambda c: self.__run_chunk.remote(function, c)
 
-        self.__max_num_cpu: int = None
-        self.__max_num_gpu: int = None
-        self.__function: ray.remote_function.RemoteFunction = function
+    def __run_chunked(
+        self,
+        engine: "CompletionEngine",
+        max_in_flight: int,
+        parameters: Iterable[Iterable[Any]],
+        submit_chunk: Callable[[List[Iterable[Any]]], "ray.ObjectRef"],
+        done: Callable[["ray.ObjectRef"], None] = None,
+    ) -> Iterable[Tuple[Iterable[Any], Any]]:
+        # Keep at least one chunk for every slot in the window, so all workers get work.
+        sizer = ChunkSizer(
+            chunk_size=self.chunk_size or None,
+            max_chunk_size=max(self.job_count // max_in_flight, 1),
+        )
+
+        chunks = engine.run_items(submit_chunk, chunk(parameters, sizer), done)
+
+        for items_chunk, (results, elapsed_seconds) in chunks:
+            sizer.record(len(results), elapsed_seconds)
+
+            # Yield items rather than chunks, so progress is still counted per item.
+            yield from zip(items_chunk, results)
 
-    def __to_iterator(self, futures: Iterable[ray.ObjectRef]) -> Iterable[Any]:
-        while futures:
-            done, futures = ray.wait(futures)
-            yield ray.get(done[0])
+    def __open_journal(self) -> Journal:
+        if not self.checkpoint:
+            return None
 
-    def __tqdm(self, futures: Iterable[ray.ObjectRef], **kwargs) -> Iterable[Any]:
-        return tqdm(self.__to_iterator(futures), **kwargs)
+        filesystem = self.output_filesystem
+        if filesystem is None:
+            from fsspec import filesystem as fsspec_filesystem
+
+            filesystem = fsspec_filesystem("file")
+
+        return Journal(filesystem, self.checkpoint)
+
+    def __skip_completed(
+        self,
+        parameters: Iterable[Iterable[Any]],
+        completed: Dict[str, Any],
+        replayed: Deque[Any],
+    ) -> Iterable[Iterable[Any]]:
+        for p in parameters:
+            key = self.item_key(p)
+
+            if key is not None and key in completed:
+                replayed.append(completed[key])
+            else:
+                yield p
+
+    def __results(
+        self, parameters: Iterable[Iterable[Any]], function: Callable
+    ) -> Iterable[Any]:
+        journal = self.__open_journal()
+        if journal is None:
+            for _, result in function(parameters):
+                yield result
+
+            return
+
+        # Completed items are not run again, their recorded results are passed on as
+        # the prologue reaches them.
+        replayed: Deque[Any] = deque()
+        parameters = self.__skip_completed(parameters, journal.load(), replayed)
+
+        try:
+            for p, result in function(parameters):
+                key = self.item_key(p)
+                if key is not None:
+                    journal.record(key, result)
+
+                while replayed:
+                    yield replayed.popleft()
+
+                yield result
+
+            while replayed:
+                yield replayed.popleft()
+        finally:
+            journal.flush()
 
     def __init_ray(self) -> Tuple[float, float]:
+        # Jobs running concurrently share one Ray runtime.
+        with _ray_init_lock:
+            return self.__init_ray_once()
+
+    def __init_ray_once(self) -> Tuple[float, float]:
+        import ray
+        import yaml
+        from platformdirs import user_config_dir
+
         if ray.is_initialized():
             return None, None
 
@@ -107,8 +443,6 @@ class RayJob(Job, ABC):
             return None, None
 
         # Self Hosted Ray Cluster
-        import torch
-
         ray_config_path = (
             Path(user_config_dir("RayCli", "Engineers for Exploration", __version__))
             / "ray.yaml"
@@ -124,8 +458,9 @@ class RayJob(Job, ABC):
             ray_config["num_cpus"] = min(cpu_count(), self.__max_num_cpu or 0)
 
         if self.max_num_gpu is not None:
+            inventory = get_inventory()
             ray_config["num_gpus"] = min(
-                torch.cuda.device_count() if torch.cuda.is_available() else 1000,
+                inventory.gpu_count if inventory.cuda_available else 1000,
                 self.__max_num_gpu or 0,
             )
 
@@ -137,37 +472,92 @@ class RayJob(Job, ABC):
 
         ray.init(**ray_config)
 
-        return ray_config["num_cpus"], (
-            ray_config["num_gpus"] if "num_gpus" in ray_config else None
-        )
+        # Without a ray.yaml or limits, Ray picks the number of CPUs itself.
+        return ray_config.get("num_cpus"), ray_config.get("num_gpus")
+
+    def item_key(self, parameters: Iterable[Any]) -> str | None:
+        # Override to return a stable key for an item, to checkpoint its result.
+        return None
 
     @abstractmethod
     def prologue(self) -> Iterable[Iterable[Any]]:
         raise NotImplementedError
 
-    def __call__(self) -> None:
-        if not self.__debugger_attached:
+    def __select_backend(self) -> str:
+        if self.__plain_function is None:
+            if self.backend and self.backend != "ray":
+                raise ValueError(
+                    f"Backend {self.backend} needs the plain function, not a Ray "
+                    "remote function."
+                )
+
+            return "ray"
+
+        if self.__debugger_attached:
+            return "serial"
+
+        if self.backend:
+            if self.backend not in BACKENDS:
+                raise ValueError(
+                    f"Unknown backend {self.backend}, expected one of {BACKENDS}."
+                )
+
+            return self.backend
+
+        # Local pools do not share out GPUs, and a running Ray is already paid for.  Ray
+        # can only be running if something imported it.
+        ray = sys.modules.get("ray")
+        ray_running = ray is not None and ray.is_initialized()
+        if self.__num_gpus or ray_running or "RAY_ADDRESS" in os.environ:
+            return "ray"
+
+        return select_backend(self.job_count, self.estimated_task_seconds)
+
+    def __create_backend(self, name: str) -> Callable:
+        if name == "ray":
             self.__init_ray()
+            self.__wrap_function()
+
+            return self.__to_iterator
+
+        return create_local_backend(
+            name,
+            self.__plain_function,
+            self.__setup,
+            max_workers=self.max_num_cpu or None,
+            max_in_flight=self.max_in_flight,
+            sizer=ChunkSizer(
+                chunk_size=1 if self.chunk_size is None else self.chunk_size or None,
+                max_chunk_size=max(self.job_count // (2 * cpu_count()), 1),
+            ),
+        )
+
+    def __call__(self) -> None:
+        from tqdm import tqdm
+
+        backend = self.__create_backend(self.__select_backend())
 
         parameters = self.prologue()
+        results = self.__results(parameters, backend)
 
-        if hasattr(self.__function, "remote"):
-            results = self.__tqdm(
-                [self.__function.remote(*p) for p in parameters],
-                total=self.job_count,
-                position=2,
-                desc=self.job_definition.display_name,
-            )
-        else:
-            results = tqdm(
-                (self.__function(*p) for p in parameters),
-                total=self.job_count,
-                position=2,
-                desc=self.job_definition.display_name,
-            )
+        results = tqdm(
+            results,
+            total=self.job_count,
+            position=self.progress_position,
+            desc=self.job_definition.display_name,
+        )
+
+        if self.output_filesystem is None:
+            self.epilogue(results)
+            return
 
-        self.epilogue(results)
+        # Blocking on a full sink stops the epilogue from pulling results, which in
+        # turn stops new tasks from being submitted.
+        with ResultSink(
+            self.output_filesystem, max_pending=self.max_pending_writes or 256
+        ) as self.__result_sink:
+            self.epilogue(results)
 
     @abstractmethod
-    def epilogue(self, results: List[ray.ObjectRef]) -> None:
+    def epilogue(self, results: List["ray.ObjectRef"]) -> None:
         raise NotImplementedError
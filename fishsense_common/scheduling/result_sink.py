@@ -0,0 +1,113 @@
+import time
+from queue import Empty, Queue
+from threading import Thread
+from typing import Any, Dict, List, Set, Tuple
+
+
+class ResultSink:
+    """
+    Writes results to an fsspec filesystem in the background.  Writes are batched and
+    handed to fsspec's bulk pipe and put, which upload concurrently on async
+    filesystems.  write and upload block once max_pending writes are queued, which
+    holds back the epilogue and with it the submission of more tasks.
+    """
+
+    def __init__(
+        self,
+        filesystem: Any,
+        batch_size: int = 64,
+        flush_seconds: float = 1.0,
+        max_pending: int = 256,
+    ):
+        self.__filesystem = filesystem
+        self.__batch_size = batch_size
+        self.__flush_seconds = flush_seconds
+
+        # (path, data) for pipe, (path, local path) for put, None to stop.
+        self.__queue: Queue[Tuple[str, bytes, str] | None] = Queue(max_pending)
+        self.__error: BaseException = None
+        self.__directories: Set[str] = set()
+
+        self.written = 0
+
+        self.__thread = Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def __enter__(self) -> "ResultSink":
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def __raise_error(self):
+        # Once a flush failed, results may be missing, so every later call fails.
+        if self.__error is not None:
+            raise self.__error
+
+    def write(self, path: str, data: bytes):
+        self.__raise_error()
+        self.__queue.put((path, data, None))
+
+    def upload(self, local_path: str, path: str):
+        self.__raise_error()
+        self.__queue.put((path, None, local_path))
+
+    def close(self):
+        if self.__thread.is_alive():
+            self.__queue.put(None)
+            self.__thread.join()
+
+        self.__raise_error()
+
+    def __makedirs(self, paths: List[str]):
+        # Local filesystems do not create missing parents when writing.
+        for path in paths:
+            directory = path.rsplit("/", 1)[0]
+            if directory and directory not in self.__directories:
+                self.__filesystem.makedirs(directory, exist_ok=True)
+                self.__directories.add(directory)
+
+    def __flush(self, batch: List[Tuple[str, bytes, str]]):
+        writes: Dict[str, bytes] = {p: d for p, d, l in batch if l is None}
+        uploads = [(l, p) for p, _, l in batch if l is not None]
+
+        self.__makedirs([p for p, _, _ in batch])
+
+        if writes:
+            self.__filesystem.pipe(writes)
+
+        if uploads:
+            local_paths, paths = zip(*uploads)
+            self.__filesystem.put(list(local_paths), list(paths))
+
+        self.written += len(batch)
+
+    def __run(self):
+        stopping = False
+
+        while not stopping:
+            batch: List[Tuple[str, bytes, str]] = []
+            deadline = time.monotonic() + self.__flush_seconds
+
+            while len(batch) < self.__batch_size:
+                try:
+                    entry = self.__queue.get(
+                        timeout=max(deadline - time.monotonic(), 0)
+                    )
+                except Empty:
+                    break
+
+                if entry is None:
+                    stopping = True
+                    break
+
+                batch.append(entry)
+
+            if not batch or self.__error is not None:
+                continue
+
+            try:
+                self.__flush(batch)
+            except BaseException as e:  # pylint: disable=broad-exception-caught
+                # Raised to the writer from then on, writes after it are dropped.
+                self.__error = e
@@ -0,0 +1,36 @@
+from fsspec.implementations.cached import (
+    CachingFileSystem,
+    SimpleCacheFileSystem,
+    WholeFileCacheFileSystem,
+)
+
+from fishsense_common.scheduling.filesystems import get_cache_trimmer
+
+
+class _Trimmed:
+    def __init__(self, *args, max_size_mb: float, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # Also runs where a Ray worker unpickles the filesystem, so every process
+        # trims the storage it writes to.  fsspec only writes to the last one.
+        get_cache_trimmer().add(self.storage[-1], max_size_mb)
+
+
+class TrimmedBlockCache(_Trimmed, CachingFileSystem):
+    pass
+
+
+class TrimmedFileCache(_Trimmed, WholeFileCacheFileSystem):
+    pass
+
+
+class TrimmedSimpleCache(_Trimmed, SimpleCacheFileSystem):
+    pass
+
+
+# fsspec's caching layers, keeping their storage within max_size_mb.
+TRIMMED_CACHES = {
+    "blockcache": TrimmedBlockCache,
+    "filecache": TrimmedFileCache,
+    "simplecache": TrimmedSimpleCache,
+}
@@ -1,27 +1,52 @@
 import os
-from typing import List
+
+from fishsense_common.utils.gpu_ledger import GpuLedger, NoDevicesError, Reservation
+from fishsense_common.utils.hardware import get_inventory
+
+__ledger: GpuLedger = None
 
 
 def is_available() -> bool:
-    import torch
+    return get_inventory().cuda_available
+
+
+def get_gpu_ledger() -> GpuLedger:
+    global __ledger
+
+    if __ledger is None:
+        __ledger = GpuLedger()
+
+    return __ledger
+
 
-    return torch.cuda.is_available()
+def set_gpu_ledger(ledger: GpuLedger) -> None:
+    # E.g. a ledger over a SimulatedDeviceBackend, to test placement without GPUs.
+    global __ledger
+
+    __ledger = ledger
 
 
 def get_most_free_gpu() -> int | None:
-    if is_available():
-        import cupy
+    # Memory other processes reserved counts as used, even before they allocate it.
+    available_memory_mb = get_gpu_ledger().available_memory_mb()
+
+    if not available_memory_mb:
+        return None
 
-        free_memory: List[int] = []
+    return available_memory_mb.index(max(available_memory_mb))
 
-        for i in range(cupy.cuda.runtime.getDeviceCount()):
-            with cupy.cuda.Device(i):
-                # Index 0 is free memory, index 1 is total memory
-                free_memory.append(cupy.cuda.runtime.memGetInfo()[0])
 
-        most_free_gpu = free_memory.index(max(free_memory))
-        return most_free_gpu
-    else:
+def reserve_gpu(vram_mb: float) -> Reservation | None:
+    """
+    Reserves vram_mb on the GPU with the most memory left, so that processes starting
+    at the same time spread over the GPUs.  Release the reservation, or use it as a
+    context manager, once the memory is freed.  Returns None without GPUs.
+    """
+    ledger = get_gpu_ledger()
+
+    try:
+        return ledger.reserve(vram_mb)
+    except NoDevicesError:
         return None
 
 
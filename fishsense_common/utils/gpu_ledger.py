@@ -0,0 +1,256 @@
+import getpass
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from threading import Lock
+from typing import Dict, List, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows, reservations are only shared between threads.
+    fcntl = None
+
+# pid, device key, reserved MB, time of reservation.
+_SLOT = struct.Struct("<iqdd")
+
+
+class NoDevicesError(RuntimeError):
+    pass
+
+
+class DeviceBackend(ABC):
+    @abstractmethod
+    def devices(self) -> List[Tuple[str, float, float]]:
+        """
+        Returns a stable id, the free and the total memory in MB of every visible
+        device, in the order CUDA numbers them.  The id must be the same in every
+        process, whatever CUDA_VISIBLE_DEVICES is, e.g. the PCI address.
+        """
+        raise NotImplementedError
+
+
+class CupyDeviceBackend(DeviceBackend):
+    def devices(self) -> List[Tuple[str, float, float]]:
+        from fishsense_common.utils.hardware import get_inventory
+
+        if not get_inventory().cuda_available:
+            return []
+
+        import cupy
+
+        devices: List[Tuple[str, float, float]] = []
+
+        for i in range(cupy.cuda.runtime.getDeviceCount()):
+            properties = cupy.cuda.runtime.getDeviceProperties(i)
+            device_id = (
+                f"{properties['pciDomainID']:04x}:{properties['pciBusID']:02x}:"
+                f"{properties['pciDeviceID']:02x}"
+            )
+
+            with cupy.cuda.Device(i):
+                free_memory, total_memory = cupy.cuda.runtime.memGetInfo()
+
+            devices.append((device_id, free_memory / 1024**2, total_memory / 1024**2))
+
+        return devices
+
+
+class SimulatedDeviceBackend(DeviceBackend):
+    """
+    Devices with a fixed amount of memory, for testing placement without GPUs.  Change
+    used_memory_mb to simulate allocations.
+    """
+
+    def __init__(
+        self, total_memory_mb: List[float], used_memory_mb: List[float] = None
+    ):
+        self.total_memory_mb = list(total_memory_mb)
+        self.used_memory_mb = list(used_memory_mb or [0.0] * len(self.total_memory_mb))
+
+    def devices(self) -> List[Tuple[str, float, float]]:
+        return [
+            (f"simulated:{i}", total - used, total)
+            for i, (total, used) in enumerate(
+                zip(self.total_memory_mb, self.used_memory_mb)
+            )
+        ]
+
+
+def _device_key(device_id: str) -> int:
+    return int.from_bytes(hashlib.sha1(device_id.encode()).digest()[:8], "little") >> 1
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Someone else's process, which is alive.
+        return True
+
+    return True
+
+
+class Reservation:
+    def __init__(self, ledger: "GpuLedger", slot: int, device: int, vram_mb: float):
+        self.__ledger = ledger
+        self.__slot = slot
+        self.device = device
+        self.vram_mb = vram_mb
+
+    def __enter__(self) -> "Reservation":
+        return self
+
+    def __exit__(self, *_):
+        self.release()
+
+    def release(self):
+        if self.__slot is not None:
+            self.__ledger.release(self.__slot)
+            self.__slot = None
+
+
+class GpuLedger:
+    """
+    A table of VRAM reservations shared by every process on the host, kept in a
+    memory mapped file and guarded by a file lock.  Placement counts what other
+    processes reserved as used, even before they allocate it, so processes starting at
+    the same time spread over the devices instead of all picking the same one.  Memory
+    that was allocated for a reservation already shows as used, so of a device's used
+    memory and its reservations only the larger counts.  Reservations of processes
+    which died are dropped.
+    """
+
+    def __init__(
+        self,
+        backend: DeviceBackend = None,
+        path: str = None,
+        max_reservations: int = 1024,
+    ):
+        if path is None:
+            path = os.path.join(
+                tempfile.gettempdir(), f"fishsense-gpu-ledger-{getpass.getuser()}.bin"
+            )
+
+        self.__backend = backend or CupyDeviceBackend()
+        self.__path = path
+        self.__size = _SLOT.size * max_reservations
+        self.__max_reservations = max_reservations
+        self.__thread_lock = Lock()
+
+    def __open(self) -> Tuple[int, mmap.mmap]:
+        fd = os.open(self.__path, os.O_RDWR | os.O_CREAT, 0o600)
+
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+
+        # A new ledger is all zeros, i.e. every slot is free.
+        if os.fstat(fd).st_size < self.__size:
+            os.ftruncate(fd, self.__size)
+
+        return fd, mmap.mmap(fd, self.__size)
+
+    def __close(self, fd: int, table: mmap.mmap):
+        table.close()
+
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+        os.close(fd)
+
+    def __read(self, table: mmap.mmap) -> Dict[int, Tuple[int, int, float]]:
+        reservations: Dict[int, Tuple[int, int, float]] = {}
+
+        for slot in range(self.__max_reservations):
+            pid, key, vram_mb, _ = _SLOT.unpack_from(table, slot * _SLOT.size)
+            if pid == 0:
+                continue
+
+            if not _is_alive(pid):
+                _SLOT.pack_into(table, slot * _SLOT.size, 0, 0, 0.0, 0.0)
+                continue
+
+            reservations[slot] = pid, key, vram_mb
+
+        return reservations
+
+    def __available(
+        self,
+        reservations: Dict[int, Tuple[int, int, float]],
+        devices: List[Tuple[str, float, float]],
+    ) -> List[float]:
+        reserved: Dict[int, float] = {}
+        for _, key, vram_mb in reservations.values():
+            reserved[key] = reserved.get(key, 0.0) + vram_mb
+
+        return [
+            total_mb
+            - max(total_mb - free_mb, reserved.get(_device_key(device_id), 0.0))
+            for device_id, free_mb, total_mb in devices
+        ]
+
+    def available_memory_mb(self) -> List[float]:
+        """
+        Returns the memory of every device which is neither used nor reserved.
+        """
+        devices = self.__backend.devices()
+
+        with self.__thread_lock:
+            fd, table = self.__open()
+            try:
+                return self.__available(self.__read(table), devices)
+            finally:
+                self.__close(fd, table)
+
+    def reserve(self, vram_mb: float) -> Reservation:
+        """
+        Reserves vram_mb on the device with the most memory left and returns the
+        reservation, which should be released once the memory is no longer used.
+        """
+        devices = self.__backend.devices()
+        if not devices:
+            raise NoDevicesError("There are no devices to reserve memory on.")
+
+        with self.__thread_lock:
+            fd, table = self.__open()
+            try:
+                reservations = self.__read(table)
+                available = self.__available(reservations, devices)
+                device = available.index(max(available))
+
+                slot = next(
+                    (
+                        s
+                        for s in range(self.__max_reservations)
+                        if s not in reservations
+                    ),
+                    None,
+                )
+                if slot is None:
+                    raise RuntimeError("The GPU reservation ledger is full.")
+
+                _SLOT.pack_into(
+                    table,
+                    slot * _SLOT.size,
+                    os.getpid(),
+                    _device_key(devices[device][0]),
+                    float(vram_mb),
+                    time.time(),
+                )
+            finally:
+                self.__close(fd, table)
+
+        return Reservation(self, slot, device, vram_mb)
+
+    def release(self, slot: int):
+        with self.__thread_lock:
+            fd, table = self.__open()
+            try:
+                _SLOT.pack_into(table, slot * _SLOT.size, 0, 0, 0.0, 0.0)
+            finally:
+                self.__close(fd, table)
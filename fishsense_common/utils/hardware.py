@@ -0,0 +1,242 @@
+import ctypes
+import hashlib
+import json
+import os
+import platform
+import sys
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from threading import Lock
+from typing import List, Tuple
+
+from platformdirs import user_config_dir
+
+from fishsense_common import __version__
+
+
+@dataclass(frozen=True)
+class GpuInfo:
+    index: int
+    name: str
+    uuid: str
+    total_memory_mb: float
+
+
+@dataclass(frozen=True)
+class HardwareInventory:
+    driver_version: str | None
+    gpus: Tuple[GpuInfo, ...]
+
+    @property
+    def cuda_available(self) -> bool:
+        return len(self.gpus) > 0
+
+    @property
+    def gpu_count(self) -> int:
+        return len(self.gpus)
+
+
+class _NvmlMemory(ctypes.Structure):
+    _fields_ = [
+        ("total", ctypes.c_ulonglong),
+        ("free", ctypes.c_ulonglong),
+        ("used", ctypes.c_ulonglong),
+    ]
+
+
+__lock = Lock()
+__inventory: HardwareInventory = None
+
+
+def __get_cache_path() -> Path:
+    return (
+        Path(user_config_dir("RayCli", "Engineers for Exploration", __version__))
+        / "hardware.json"
+    )
+
+
+def __list_directory(path: str) -> List[str]:
+    try:
+        return sorted(os.listdir(path))
+    except OSError:
+        return []
+
+
+def __get_fingerprint() -> str:
+    # Cheap to compute on every start, and changes with the driver, the devices and the
+    # devices this process may see.  The host is included as home directories are
+    # often shared between the nodes of a cluster.
+    parts = [
+        platform.node(),
+        os.environ.get("CUDA_VISIBLE_DEVICES", "<unset>"),
+        *(d for d in __list_directory("/dev") if d.startswith("nvidia") or d == "dxg"),
+        *__list_directory("/proc/driver/nvidia/gpus"),
+    ]
+
+    try:
+        parts.append(Path("/proc/driver/nvidia/version").read_text())
+    except OSError:
+        pass
+
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+def __may_have_gpus() -> bool:
+    if sys.platform == "win32":
+        return True
+
+    return any(d.startswith("nvidia") or d == "dxg" for d in __list_directory("/dev"))
+
+
+def __filter_visible(gpus: List[GpuInfo]) -> List[GpuInfo]:
+    visible = os.environ.get("CUDA_VISIBLE_DEVICES")
+    if visible is None:
+        return gpus
+
+    selected = []
+    for device in (d.strip() for d in visible.split(",")):
+        if not device:
+            break
+
+        if device.isdigit():
+            matches = [g for g in gpus if g.index == int(device)]
+        else:
+            matches = [g for g in gpus if g.uuid.startswith(device)]
+
+        # CUDA ignores the devices after the first one it does not know.
+        if not matches:
+            break
+
+        selected.append(matches[0])
+
+    # Renumbered the way CUDA numbers them.
+    return [
+        GpuInfo(i, g.name, g.uuid, g.total_memory_mb) for i, g in enumerate(selected)
+    ]
+
+
+def __probe_nvml() -> HardwareInventory | None:
+    try:
+        nvml = ctypes.CDLL("libnvidia-ml.so.1")
+    except OSError:
+        return None
+
+    if nvml.nvmlInit_v2() != 0:
+        return None
+
+    try:
+        buffer = ctypes.create_string_buffer(96)
+
+        nvml.nvmlSystemGetDriverVersion(buffer, len(buffer))
+        driver_version = buffer.value.decode()
+
+        count = ctypes.c_uint()
+        if nvml.nvmlDeviceGetCount_v2(ctypes.byref(count)) != 0:
+            return None
+
+        gpus: List[GpuInfo] = []
+        for index in range(count.value):
+            handle = ctypes.c_void_p()
+            if nvml.nvmlDeviceGetHandleByIndex_v2(index, ctypes.byref(handle)) != 0:
+                return None
+
+            memory = _NvmlMemory()
+            nvml.nvmlDeviceGetMemoryInfo(handle, ctypes.byref(memory))
+
+            nvml.nvmlDeviceGetName(handle, buffer, len(buffer))
+            name = buffer.value.decode()
+
+            nvml.nvmlDeviceGetUUID(handle, buffer, len(buffer))
+            uuid = buffer.value.decode()
+
+            gpus.append(GpuInfo(index, name, uuid, memory.total / 1024**2))
+
+        return HardwareInventory(driver_version, tuple(__filter_visible(gpus)))
+    finally:
+        nvml.nvmlShutdown()
+
+
+def __probe_torch() -> HardwareInventory:
+    import torch  # Only when NVML is missing, importing torch is slow.
+
+    if not torch.cuda.is_available():
+        return HardwareInventory(None, ())
+
+    gpus = []
+    for index in range(torch.cuda.device_count()):
+        properties = torch.cuda.get_device_properties(index)
+        gpus.append(
+            GpuInfo(
+                index,
+                properties.name,
+                str(getattr(properties, "uuid", "")),
+                float(properties.total_memory) / 1024**2,
+            )
+        )
+
+    return HardwareInventory(torch.version.cuda, tuple(gpus))
+
+
+def __probe() -> HardwareInventory:
+    if not __may_have_gpus():
+        return HardwareInventory(None, ())
+
+    inventory = __probe_nvml()
+    if inventory is not None:
+        return inventory
+
+    return __probe_torch()
+
+
+def __load(fingerprint: str) -> HardwareInventory | None:
+    try:
+        with __get_cache_path().open("r") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if cached.get("fingerprint") != fingerprint:
+        return None
+
+    return HardwareInventory(
+        cached["driver_version"], tuple(GpuInfo(**g) for g in cached["gpus"])
+    )
+
+
+def __save(fingerprint: str, inventory: HardwareInventory):
+    path = __get_cache_path()
+    temporary_path = path.with_suffix(f".{os.getpid()}.tmp")
+
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with temporary_path.open("w") as f:
+            json.dump({"fingerprint": fingerprint, **asdict(inventory)}, f)
+
+        # Atomic, so concurrent drivers never read half a file.
+        os.replace(temporary_path, path)
+    except OSError:
+        # A read-only home directory only costs probing again next time.
+        pass
+
+
+def get_inventory(refresh: bool = False) -> HardwareInventory:
+    """
+    Returns the GPUs this process can use, probed once and cached in-process and on
+    disk.  NVML is used when available, so torch and cupy are not imported.
+    """
+    global __inventory
+
+    with __lock:
+        if __inventory is not None and not refresh:
+            return __inventory
+
+        fingerprint = __get_fingerprint()
+
+        inventory = None if refresh else __load(fingerprint)
+        if inventory is None:
+            inventory = __probe()
+            __save(fingerprint, inventory)
+
+        __inventory = inventory
+
+        return inventory
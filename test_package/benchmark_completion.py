@@ -0,0 +1,50 @@
+import time
+from typing import Any, Iterable, List
+
+import ray
+
+from fishsense_common.ray.completion import CompletionEngine
+
+
+@ray.remote
+def noop(x: int) -> int:
+    return x
+
+
+def one_at_a_time(futures: List[ray.ObjectRef]) -> Iterable[Any]:
+    # How RayJob and Command.tqdm harvested results before the completion engine.
+    while futures:
+        done, futures = ray.wait(futures)
+        yield ray.get(done[0])
+
+
+def benchmark(count: int, max_in_flight: int):
+    start = time.perf_counter()
+    results = list(one_at_a_time([noop.remote(i) for i in range(count)]))
+    one_at_a_time_seconds = time.perf_counter() - start
+    assert sorted(results) == list(range(count))
+
+    start = time.perf_counter()
+    results = list(
+        CompletionEngine(max_in_flight=max_in_flight).run(noop.remote, range(count))
+    )
+    engine_seconds = time.perf_counter() - start
+    assert sorted(results) == list(range(count))
+
+    print(
+        f"{count:>6} tasks: one at a time {one_at_a_time_seconds:7.2f}s, "
+        f"engine {engine_seconds:7.2f}s "
+        f"({one_at_a_time_seconds / engine_seconds:.1f}x)"
+    )
+
+
+if __name__ == "__main__":
+    ray.init(include_dashboard=False, log_to_driver=False)
+
+    max_in_flight = 2 * int(ray.cluster_resources()["CPU"])
+
+    # Warm up the workers so that the first run is not charged for starting them.
+    list(CompletionEngine().run(noop.remote, range(100)))
+
+    for count in (1000, 4000, 16000):
+        benchmark(count, max_in_flight)
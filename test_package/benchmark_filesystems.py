@@ -0,0 +1,100 @@
+import os
+import pickle
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+
+from fsspec import AbstractFileSystem, filesystem
+
+from fishsense_common.scheduling.filesystems import (
+    CACHE_TYPES,
+    CacheTrimmer,
+    get_filesystem,
+)
+
+
+def per_task(tasks: int, get_fs) -> float:
+    start = time.perf_counter()
+    for _ in range(tasks):
+        get_fs().cat_file("/benchmark/item.bin")
+
+    return (time.perf_counter() - start) / tasks
+
+
+def main() -> int:
+    parser = ArgumentParser(description="Compares fresh and shared filesystems.")
+    parser.add_argument("--tasks", type=int, default=10000)
+    args = parser.parse_args()
+
+    memory = get_filesystem({"protocol": "memory"})
+    memory.pipe_file("/benchmark/item.bin", os.urandom(1024))
+
+    fresh_seconds = per_task(
+        args.tasks, lambda: filesystem("memory", skip_instance_cache=True)
+    )
+    pickled = pickle.dumps(memory)
+    shared_seconds = per_task(args.tasks, lambda: pickle.loads(pickled))
+
+    print(f"fresh filesystem per task: {fresh_seconds * 1e6:.1f}us")
+    print(
+        f"unpickled shared filesystem per task: {shared_seconds * 1e6:.1f}us, "
+        f"{len(pickled)} bytes pickled"
+    )
+
+    failures = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for i in range(8):
+            paths.append(os.path.join(directory, f"source-{i}.bin"))
+            with open(paths[-1], "wb") as f:
+                f.write(os.urandom(1024**2))
+
+        for cache_type in CACHE_TYPES:
+            storage = os.path.join(directory, cache_type)
+            fs = get_filesystem(
+                {
+                    "protocol": "file",
+                    "cache": {
+                        "type": cache_type,
+                        "max_size_mb": 4,
+                        "kwargs": {"cache_storage": storage},
+                    },
+                }
+            )
+            # Trims after every read instead of on the background thread.
+            trimmer = CacheTrimmer()
+            trimmer.add(storage, 4)
+
+            for path in paths + paths[:1]:
+                with open(path, "rb") as f:
+                    expected = f.read()
+
+                if fs.cat_file(path) != expected:
+                    failures.append(f"{cache_type} read {path} wrong")
+
+                trimmer.trim()
+
+            size_mb = sum(
+                e.stat().st_size for e in os.scandir(storage) if e.name != "cache"
+            ) / (1024**2)
+            print(f"{cache_type}: {size_mb:.1f}MB cached of 8MB read")
+
+            if size_mb > 4:
+                failures.append(f"{cache_type} cached {size_mb:.1f}MB")
+
+            if pickle.loads(pickle.dumps(fs)) is not fs:
+                failures.append(f"{cache_type} did not unpickle as the same instance")
+
+    if not isinstance(pickle.loads(pickled), AbstractFileSystem):
+        failures.append("the filesystem did not unpickle as a filesystem")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# None of these should be imported to show help.
+HEAVY_MODULES = ("ray", "torch", "cupy", "fsspec", "yaml", "tqdm", "wakepy")
+
+ENTRY_POINTS = {
+    "pluggable_cli --help": ["-m", "test_package.test_cli"],
+    "CliScheduler --help": [
+        "-c",
+        "from fishsense_common.scheduling.cli_scheduler import CliScheduler; "
+        "CliScheduler(name='test-scheduler')()",
+    ],
+    # Defining and registering a job loads ray_job and what it imports.
+    "CliScheduler with a RayJob --help": [
+        "-c",
+        "from fishsense_common.scheduling.cli_scheduler import CliScheduler\n"
+        "from fishsense_common.scheduling.ray_job import RayJob\n"
+        "class StubJob(RayJob):\n"
+        "    name = 'stub'\n"
+        "    job_count = 0\n"
+        "    prologue = epilogue = lambda self, *args: None\n"
+        "scheduler = CliScheduler(name='test-scheduler')\n"
+        "scheduler.register_job_type(StubJob)\n"
+        "scheduler()",
+    ],
+}
+
+
+def run_help(entry_point: List[str]) -> Tuple[float, Dict[str, int], int]:
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", *entry_point, "--help"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    elapsed_seconds = time.perf_counter() - start
+
+    # Lines look like "import time:   self [us] | cumulative | package".
+    # Nested imports are indented, only top level imports add up to the total.
+    cumulative_us: Dict[str, int] = {}
+    total_us = 0
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        _, cumulative, package = line.split("|")
+        cumulative_us[package.strip()] = int(cumulative)
+
+        if not package[1:].startswith(" "):
+            total_us += int(cumulative)
+
+    return elapsed_seconds, cumulative_us, total_us
+
+
+def main() -> int:
+    parser = ArgumentParser(description="Checks how long a cold --help takes.")
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=0.5,
+        help="The most seconds a cold --help may take.",
+    )
+    args = parser.parse_args()
+
+    failures: List[str] = []
+
+    for name, entry_point in ENTRY_POINTS.items():
+        elapsed_seconds, cumulative_us, total_us = run_help(entry_point)
+        heavy = [m for m in HEAVY_MODULES if m in cumulative_us]
+
+        print(f"{name}: {elapsed_seconds:.3f}s, imports {total_us / 1e6:.3f}s")
+        for module in heavy:
+            print(f"  {module}: {cumulative_us[module] / 1e6:.3f}s")
+
+        if elapsed_seconds > args.budget:
+            failures.append(f"{name} took {elapsed_seconds:.3f}s")
+
+        if heavy:
+            failures.append(f"{name} imported {', '.join(heavy)}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
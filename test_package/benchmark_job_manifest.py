@@ -0,0 +1,70 @@
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from itertools import islice
+from pathlib import Path
+from typing import Callable
+
+import yaml
+
+from fishsense_common.scheduling.job_manifest import load_manifest
+
+
+def measure(name: str, load: Callable[[], int]):
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = load()
+    elapsed_seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{name}: {count} jobs, {elapsed_seconds:.2f}s, peak {peak / 1024**2:.1f}MB")
+
+
+def main() -> int:
+    parser = ArgumentParser(description="Compares loading YAML and JSON Lines jobs.")
+    parser.add_argument("--jobs", type=int, default=20000)
+    args = parser.parse_args()
+
+    header = {"input_filesystem": {"protocol": "file"}}
+    jobs = [
+        {
+            "display_name": f"Job {i}",
+            "job_name": "process",
+            "parameters": {"input": f"data/{i:06d}.png", "threshold": 0.5},
+        }
+        for i in range(args.jobs)
+    ]
+
+    with tempfile.TemporaryDirectory() as directory:
+        yaml_path = Path(directory) / "jobs.yaml"
+        with yaml_path.open("w") as f:
+            yaml.safe_dump({**header, "jobs": jobs}, f)
+
+        jsonl_path = Path(directory) / "jobs.jsonl"
+        with jsonl_path.open("w") as f:
+            for line in [header, *jobs]:
+                f.write(json.dumps(line) + "\n")
+
+        def load_pure_yaml() -> int:
+            with yaml_path.open() as f:
+                return len(yaml.load(f, Loader=yaml.SafeLoader)["jobs"])
+
+        measure("yaml, pure Python loader", load_pure_yaml)
+        measure("yaml", lambda: len(load_manifest(yaml_path)[1]))
+        measure("jsonl, all jobs", lambda: sum(1 for _ in load_manifest(jsonl_path)[1]))
+        measure(
+            "jsonl, first job",
+            lambda: len(list(islice(load_manifest(jsonl_path)[1], 1))),
+        )
+
+    print(f"libyaml: {'yes' if hasattr(yaml, 'CSafeLoader') else 'no'}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
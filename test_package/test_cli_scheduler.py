@@ -0,0 +1,161 @@
+import json
+import sys
+import time
+from pathlib import Path
+from threading import Barrier
+from typing import Callable, Dict, List
+
+import pytest
+import yaml
+
+from fishsense_common.scheduling.cli_scheduler import CliScheduler
+from fishsense_common.scheduling.job import Job
+
+
+class RecordingJob(Job):
+    name = "record"
+
+    # Behaviour and recorded shares, by display name.
+    hooks: Dict[str, Callable[["RecordingJob", List[float]], None]] = {}
+    shares: Dict[str, List[float]] = {}
+
+    def __call__(self) -> None:
+        shares = self.shares.setdefault(self.job_definition.display_name, [])
+        self.hooks.get(self.job_definition.display_name, lambda *_: None)(self, shares)
+        shares.append(self.share)
+
+
+def run_jobs(monkeypatch, tmp_path, jobs: List[Dict], *arguments: str):
+    path = tmp_path / "jobs.yaml"
+    path.write_text(yaml.safe_dump({"jobs": jobs}))
+
+    run_file(monkeypatch, path, *arguments)
+
+
+def run_file(monkeypatch, path: Path, *arguments: str):
+    scheduler = CliScheduler(name="test-scheduler")
+    scheduler.register_job_type(RecordingJob)
+
+    monkeypatch.setattr(sys, "argv", ["x", "run-jobs", str(path), *arguments])
+    scheduler()
+
+
+def job(name: str, weight: float, **kwargs) -> Dict:
+    return {
+        "display_name": name,
+        "job_name": "record",
+        "parameters": {},
+        "weight": weight,
+        **kwargs,
+    }
+
+
+def test_share_grows_when_other_jobs_finish(monkeypatch, tmp_path):
+    started, recorded = Barrier(2), Barrier(2)
+
+    def long(job: RecordingJob, shares: List[float]):
+        started.wait(timeout=10)
+        shares.append(job.share)
+        recorded.wait(timeout=10)
+
+        deadline = time.monotonic() + 10
+        while job.share < 1.0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    RecordingJob.shares = {}
+
+    def short(*_):
+        started.wait(timeout=10)
+        recorded.wait(timeout=10)
+
+    RecordingJob.hooks = {"Long": long, "Short": short}
+
+    run_jobs(
+        monkeypatch,
+        tmp_path,
+        [job("Long", 1), job("Short", 3)],
+        "--max-concurrent-jobs",
+        "2",
+    )
+
+    assert RecordingJob.shares == {"Long": [0.25, 1.0], "Short": [0.75]}
+
+
+def test_a_job_running_alone_gets_the_whole_cluster(monkeypatch, tmp_path):
+    RecordingJob.shares = {}
+    RecordingJob.hooks = {}
+
+    run_jobs(
+        monkeypatch,
+        tmp_path,
+        [job("First", 1), job("Second", 3, depends_on="First")],
+    )
+
+    assert RecordingJob.shares == {"First": [1.0], "Second": [1.0]}
+
+
+def test_jobs_without_ray_do_not_import_it(monkeypatch, tmp_path):
+    RecordingJob.shares = {}
+    RecordingJob.hooks = {}
+    monkeypatch.delitem(sys.modules, "ray", raising=False)
+
+    run_jobs(monkeypatch, tmp_path, [job("First", 1)])
+    run_jobs(monkeypatch, tmp_path, [job("First", 1)], "--max-concurrent-jobs", "2")
+
+    assert "ray" not in sys.modules
+
+
+def test_streamed_jobs_start_before_the_manifest_is_read(monkeypatch, tmp_path):
+    RecordingJob.shares = {}
+    RecordingJob.hooks = {}
+
+    path = tmp_path / "jobs.jsonl"
+    path.write_text(
+        "".join(json.dumps(j) + "\n" for j in [job("First", 1), job("Second", 1)])
+        + "not json\n"
+    )
+
+    with pytest.raises(ValueError, match="jobs.jsonl:3 is not valid JSON"):
+        run_file(monkeypatch, path, "--max-concurrent-jobs", "2")
+
+    assert set(RecordingJob.shares) == {"First", "Second"}
+
+
+def test_streamed_jobs_wait_for_their_dependencies(monkeypatch, tmp_path):
+    order: List[str] = []
+
+    def fail(*_):
+        raise RuntimeError("broken")
+
+    RecordingJob.shares = {}
+    RecordingJob.hooks = {
+        "Broken": fail,
+        **{n: lambda j, _: order.append(j.job_definition.display_name) for n in "ABC"},
+    }
+
+    path = tmp_path / "jobs.jsonl"
+    jobs = [
+        job("A", 1, depends_on="B"),
+        job("Skipped", 1, depends_on="Broken"),
+        job("Broken", 1),
+        job("B", 1, depends_on="C"),
+        job("C", 1),
+    ]
+    path.write_text("".join(json.dumps(j) + "\n" for j in jobs))
+
+    with pytest.raises(RuntimeError, match="1 of 5 jobs failed: Broken"):
+        run_file(monkeypatch, path, "--max-concurrent-jobs", "2")
+
+    assert order == ["C", "B", "A"]
+    assert "Skipped" not in RecordingJob.shares
+
+
+def test_streamed_jobs_with_unlisted_dependencies(monkeypatch, tmp_path):
+    RecordingJob.shares = {}
+    RecordingJob.hooks = {}
+
+    path = tmp_path / "jobs.jsonl"
+    path.write_text(json.dumps(job("First", 1, depends_on="Missing")) + "\n")
+
+    with pytest.raises(ValueError, match="First depend on jobs which are not listed"):
+        run_file(monkeypatch, path, "--max-concurrent-jobs", "2")
@@ -0,0 +1,239 @@
+import heapq
+from collections import deque
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+import pytest
+
+from fishsense_common.ray import completion
+from fishsense_common.ray.completion import CompletionEngine, StragglerPolicy
+
+
+class FakeRayError(Exception):
+    pass
+
+
+class FakeRef:
+    def __init__(self, item: Any, duration: float, result: Any, error: Exception):
+        self.item = item
+        self.duration = duration
+        self.result = result
+        self.error = error
+        self.ended_at: float = None
+        self.done = False
+
+
+class FakeRay:
+    """
+    Runs submitted tasks in order on a number of slots, on a simulated clock which only
+    moves inside wait.
+    """
+
+    def __init__(self, slots: int):
+        self.exceptions = SimpleNamespace(RayError=FakeRayError)
+        self.now = 0.0
+        self.cancelled: List[FakeRef] = []
+        self.submitted: List[FakeRef] = []
+
+        self.__slots = slots
+        self.__queued: deque[FakeRef] = deque()
+        self.__running: List[tuple] = []
+
+    def submit(
+        self, item: Any, duration: float, result: Any = None, error: Exception = None
+    ) -> FakeRef:
+        ref = FakeRef(item, duration, result, error)
+        self.submitted.append(ref)
+        self.__queued.append(ref)
+        self.__schedule()
+
+        return ref
+
+    def __schedule(self):
+        while self.__queued and len(self.__running) < self.__slots:
+            ref = self.__queued.popleft()
+            ref.ended_at = self.now + ref.duration
+            heapq.heappush(self.__running, (ref.ended_at, id(ref), ref))
+
+    def __next_event(self) -> float:
+        return self.__running[0][0] if self.__running else None
+
+    def __complete_until(self, until: float):
+        while self.__running and self.__running[0][0] <= until:
+            ended_at, _, ref = heapq.heappop(self.__running)
+            self.now = max(self.now, ended_at)
+            ref.done = True
+            self.__schedule()
+
+    def wait(self, refs: List[FakeRef], num_returns: int, timeout: float):
+        deadline = self.now + timeout
+
+        while sum(r.done for r in refs) < num_returns:
+            next_event = self.__next_event()
+            if next_event is None or next_event > deadline:
+                self.now = deadline
+                break
+
+            self.__complete_until(next_event)
+
+        ready = [r for r in refs if r.done][:num_returns]
+        return ready, [r for r in refs if r not in ready]
+
+    def get(self, refs):
+        if not isinstance(refs, list):
+            if refs.error is not None:
+                raise refs.error
+            return refs.result
+
+        return [self.get(r) for r in refs]
+
+    def cancel(self, ref: FakeRef, force: bool = False):
+        self.cancelled.append(ref)
+        self.__queued = deque(r for r in self.__queued if r is not ref)
+        self.__running = [e for e in self.__running if e[2] is not ref]
+        heapq.heapify(self.__running)
+        self.__schedule()
+
+
+@pytest.fixture
+def fake_ray(monkeypatch):
+    def create(slots: int) -> FakeRay:
+        fake = FakeRay(slots)
+        monkeypatch.setattr(completion, "ray", fake)
+        monkeypatch.setattr(
+            completion, "time", SimpleNamespace(monotonic=lambda: fake.now)
+        )
+        return fake
+
+    return create
+
+
+def test_timeout_does_not_count_queued_time(fake_ray):
+    ray = fake_ray(slots=2)
+    policy = StragglerPolicy(timeout_seconds=1.6)
+
+    def submit(item):
+        return ray.submit(item, 1.0, item * 10)
+
+    # Twice as many in flight as there are slots, so half of them are always queued.
+    engine = CompletionEngine(max_in_flight=4, stragglers=policy, slots=2)
+    results = dict(engine.run_items(submit, range(8)))
+    assert results == {i: i * 10 for i in range(8)}
+    assert not ray.cancelled
+
+    # Measured from submission, the queued tasks time out.
+    engine = CompletionEngine(max_in_flight=4, stragglers=policy)
+    with pytest.raises(TimeoutError):
+        list(engine.run_items(submit, range(8)))
+
+
+def test_failures_are_retried(fake_ray):
+    ray = fake_ray(slots=4)
+    attempts: Dict[int, int] = {}
+
+    def submit(item):
+        attempts[item] = attempts.get(item, 0) + 1
+        if item == 2 and attempts[item] == 1:
+            return ray.submit(item, 1.0, error=FakeRayError("flaky"))
+
+        return ray.submit(item, 1.0, item)
+
+    engine = CompletionEngine(stragglers=StragglerPolicy(max_retries=1), slots=4)
+
+    assert sorted(engine.run(submit, range(4))) == [0, 1, 2, 3]
+    assert attempts == {0: 1, 1: 1, 2: 2, 3: 1}
+
+    engine = CompletionEngine(stragglers=StragglerPolicy(max_retries=0), slots=4)
+    attempts.clear()
+    with pytest.raises(FakeRayError):
+        list(engine.run(submit, range(4)))
+
+
+def test_timed_out_attempts_are_cancelled_and_retried(fake_ray):
+    ray = fake_ray(slots=2)
+    attempts: Dict[int, int] = {}
+
+    def submit(item):
+        attempts[item] = attempts.get(item, 0) + 1
+        hangs = item == 1 and attempts[item] == 1
+
+        return ray.submit(item, 100.0 if hangs else 1.0, item)
+
+    engine = CompletionEngine(
+        stragglers=StragglerPolicy(timeout_seconds=5, max_retries=1), slots=2
+    )
+
+    assert list(engine.run(submit, range(3))) == [0, 2, 1]
+    assert [r.item for r in ray.cancelled] == [1]
+
+    engine = CompletionEngine(
+        stragglers=StragglerPolicy(timeout_seconds=5, max_retries=0), slots=2
+    )
+    attempts.clear()
+    with pytest.raises(TimeoutError):
+        list(engine.run(submit, range(3)))
+
+
+def test_speculative_duplicate_finishing_with_the_original(fake_ray):
+    ray = fake_ray(slots=8)
+    done: List[FakeRef] = []
+
+    def submit(item):
+        first = next((r for r in ray.submitted if r.item == item), None)
+        if first is not None:
+            # The duplicate ends together with the original, in the same batch.
+            return ray.submit(item, first.ended_at - ray.now, f"{item} again")
+
+        return ray.submit(item, {0: 10.0, 3: 2.0, 4: 2.0}.get(item, 1.0), item)
+
+    engine = CompletionEngine(
+        timeout_seconds=100,
+        stragglers=StragglerPolicy(speculate_percentile=0, min_samples=2),
+        slots=8,
+    )
+    results = list(engine.run_items(submit, range(5), done=done.append))
+
+    assert sorted(item for item, _ in results) == [0, 1, 2, 3, 4]
+    assert dict(results)[0] == 0
+    assert [r.item for r in ray.submitted].count(0) == 2
+    assert not ray.cancelled
+    assert sorted(done, key=id) == sorted(ray.submitted, key=id)
+
+
+def test_slow_originals_are_cancelled_once_a_duplicate_wins(fake_ray):
+    ray = fake_ray(slots=8)
+
+    def submit(item):
+        if any(r.item == item for r in ray.submitted):
+            return ray.submit(item, 1.0, item)
+
+        return ray.submit(item, 50.0 if item == 0 else 1.0, item)
+
+    engine = CompletionEngine(
+        stragglers=StragglerPolicy(speculate_percentile=50, min_samples=2), slots=8
+    )
+
+    assert sorted(engine.run(submit, range(4))) == [0, 1, 2, 3]
+    assert [r.item for r in ray.cancelled] == [0]
+    assert ray.now < 50
+
+
+def test_max_in_flight_is_read_again_on_every_refill(fake_ray):
+    ray = fake_ray(slots=8)
+    limit = [1]
+    in_flight: List[int] = []
+
+    def submit(item):
+        # The limit grows once a few items are done, as when another job finishes.
+        if item == 3:
+            limit[0] = 4
+
+        ref = ray.submit(item, 1.0, item)
+        in_flight.append(sum(not r.done for r in ray.submitted))
+        return ref
+
+    engine = CompletionEngine(max_in_flight=lambda: limit[0], slots=8)
+
+    assert sorted(engine.run(submit, range(12))) == list(range(12))
+    assert in_flight[:3] == [1, 1, 1]
+    assert max(in_flight) == 4
@@ -0,0 +1,81 @@
+import multiprocessing
+from collections import Counter
+
+from fishsense_common.utils.gpu_ledger import GpuLedger, SimulatedDeviceBackend
+
+DEVICE_COUNT = 4
+TOTAL_MEMORY_MB = 16000.0
+
+
+def reserve_and_hold(path: str, barrier, devices) -> None:
+    ledger = GpuLedger(SimulatedDeviceBackend([TOTAL_MEMORY_MB] * DEVICE_COUNT), path)
+
+    with ledger.reserve(4000) as reservation:
+        devices.put(reservation.device)
+        # Hold the reservation until every process has placed its own.
+        barrier.wait()
+
+
+def test_processes_spread_over_devices(tmp_path):
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(2 * DEVICE_COUNT)
+    devices = context.Queue()
+
+    processes = [
+        context.Process(
+            target=reserve_and_hold, args=(str(tmp_path / "ledger"), barrier, devices)
+        )
+        for _ in range(2 * DEVICE_COUNT)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=60)
+        assert process.exitcode == 0
+
+    placed = Counter(devices.get(timeout=1) for _ in processes)
+    assert placed == {d: 2 for d in range(DEVICE_COUNT)}
+
+
+def test_allocated_reservations_count_once(tmp_path):
+    backend = SimulatedDeviceBackend([TOTAL_MEMORY_MB] * 2)
+    ledger = GpuLedger(backend, str(tmp_path / "ledger"))
+
+    first = ledger.reserve(4000)
+    assert first.device == 0
+    assert ledger.available_memory_mb() == [12000, 16000]
+
+    # The memory is allocated, which takes it out of the free memory as well.
+    backend.used_memory_mb[0] = 4000
+    assert ledger.available_memory_mb() == [12000, 16000]
+
+    second = ledger.reserve(4000)
+    assert second.device == 1
+    assert ledger.available_memory_mb() == [12000, 12000]
+
+    # Memory used beyond the reservations still counts.
+    backend.used_memory_mb[0] = 6000
+    assert ledger.available_memory_mb() == [10000, 12000]
+    assert ledger.reserve(1000).device == 1
+
+    first.release()
+    assert ledger.available_memory_mb() == [10000, 11000]
+
+
+def test_placement_with_some_reservations_allocated(tmp_path):
+    backend = SimulatedDeviceBackend([TOTAL_MEMORY_MB] * DEVICE_COUNT)
+    ledger = GpuLedger(backend, str(tmp_path / "ledger"))
+
+    # Every other process has allocated its memory by the time the next one starts.
+    reservations = []
+    for i in range(2 * DEVICE_COUNT):
+        reservation = ledger.reserve(4000)
+        reservations.append(reservation)
+
+        if i % 2 == 0:
+            backend.used_memory_mb[reservation.device] += 4000
+
+    assert Counter(r.device for r in reservations) == {
+        d: 2 for d in range(DEVICE_COUNT)
+    }
+    assert ledger.available_memory_mb() == [8000] * DEVICE_COUNT
@@ -0,0 +1,53 @@
+from typing import List
+
+import pytest
+
+from fishsense_common.scheduling.job_definition import JobDefinition
+from fishsense_common.scheduling.job_graph import build_job_graph
+
+
+def job(name: str, depends_on: List[str] | str = None) -> JobDefinition:
+    return JobDefinition(name, "test", {}, depends_on=depends_on)
+
+
+def test_dependencies_are_resolved_by_display_name():
+    jobs = [
+        job("Calibrate"),
+        job("Detect", depends_on="Calibrate"),
+        job("Measure", depends_on=["Calibrate", "Detect"]),
+        job("Report", depends_on=["Measure"]),
+    ]
+
+    assert build_job_graph(jobs) == [set(), {0}, {0, 1}, {2}]
+
+
+def test_unknown_name():
+    jobs = [job("Detect", depends_on="Calibrate")]
+
+    with pytest.raises(ValueError, match="Detect depends on Calibrate, which does"):
+        build_job_graph(jobs)
+
+
+def test_ambiguous_name():
+    jobs = [job("Calibrate"), job("Calibrate"), job("Detect", depends_on="Calibrate")]
+
+    with pytest.raises(ValueError, match="more than one job"):
+        build_job_graph(jobs)
+
+
+def test_cycle():
+    jobs = [
+        job("Calibrate"),
+        job("Detect", depends_on=["Calibrate", "Measure"]),
+        job("Measure", depends_on="Detect"),
+        job("Report", depends_on="Measure"),
+    ]
+
+    # Report cannot run either, as it waits on the cycle.
+    with pytest.raises(ValueError, match="cycle through Detect, Measure, Report"):
+        build_job_graph(jobs)
+
+
+def test_self_dependency_is_a_cycle():
+    with pytest.raises(ValueError, match="cycle through Calibrate"):
+        build_job_graph([job("Calibrate", depends_on="Calibrate")])
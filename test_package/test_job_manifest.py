@@ -0,0 +1,121 @@
+import gzip
+import json
+from pathlib import Path
+from typing import Any, Dict, List
+
+import pytest
+import yaml
+
+from fishsense_common.scheduling.job_manifest import load_manifest
+
+HEADER = {"input_filesystem": {"protocol": "memory"}}
+JOBS = [
+    {"display_name": "Low", "job_name": "process", "parameters": {"n": 1}},
+    {
+        "display_name": "High",
+        "job_name": "process",
+        "parameters": {"n": 2},
+        "priority": 5,
+    },
+    {"display_name": "Also low", "job_name": "process", "parameters": {"n": 3}},
+]
+
+
+def write_jsonl(path: Path, lines: List[Dict[str, Any]]):
+    text = "".join(json.dumps(line) + "\n\n" for line in lines)
+
+    if path.suffix == ".gz":
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        path.write_text(text, encoding="utf-8")
+
+
+@pytest.mark.parametrize("name", ["jobs.jsonl", "jobs.jsonl.gz"])
+def test_jsonl_runs_in_file_order(tmp_path, name):
+    path = tmp_path / name
+    write_jsonl(path, [{"input_filesystem": {"protocol": "file"}}, HEADER, *JOBS])
+
+    header, jobs = load_manifest(path)
+
+    # Later header lines win.
+    assert header == HEADER
+    assert [j.display_name for j in jobs] == ["Low", "High", "Also low"]
+
+
+def test_jsonl_jobs_are_read_lazily(tmp_path):
+    path = tmp_path / "jobs.jsonl"
+    write_jsonl(path, [HEADER, *JOBS])
+    with path.open("a") as f:
+        f.write("not json\n")
+
+    _, jobs = load_manifest(path)
+
+    assert next(iter(jobs)).display_name == "Low"
+
+
+def test_jsonl_without_jobs(tmp_path):
+    path = tmp_path / "jobs.jsonl"
+    write_jsonl(path, [HEADER])
+
+    header, jobs = load_manifest(path)
+
+    assert header == HEADER
+    assert list(jobs) == []
+
+
+def test_jsonl_header_after_first_job(tmp_path):
+    path = tmp_path / "jobs.jsonl"
+    write_jsonl(path, [HEADER, JOBS[0], HEADER])
+
+    _, jobs = load_manifest(path)
+
+    with pytest.raises(ValueError, match=r"jobs.jsonl:5 is a header after the first"):
+        list(jobs)
+
+
+def test_jsonl_unknown_header_key(tmp_path):
+    path = tmp_path / "jobs.jsonl"
+    write_jsonl(path, [{"input_filesystm": {}}, *JOBS])
+
+    with pytest.raises(ValueError, match="unknown keys input_filesystm"):
+        load_manifest(path)
+
+
+def test_jsonl_invalid_line(tmp_path):
+    path = tmp_path / "jobs.jsonl"
+    path.write_text("{}\n{\n")
+
+    with pytest.raises(ValueError, match=r"jobs.jsonl:2 is not valid JSON"):
+        load_manifest(path)
+
+
+@pytest.mark.parametrize("name", ["jobs.yaml", "jobs.yml.gz", "jobs.json"])
+def test_documents_are_sorted_by_priority(tmp_path, name):
+    path = tmp_path / name
+    text = (json.dumps if ".json" in name else yaml.safe_dump)({**HEADER, "jobs": JOBS})
+
+    if name.endswith(".gz"):
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        path.write_text(text, encoding="utf-8")
+
+    header, jobs = load_manifest(path)
+
+    assert header == HEADER
+    # Jobs of the same priority keep the order of the file.
+    assert [j.display_name for j in jobs] == ["High", "Low", "Also low"]
+
+
+def test_document_without_jobs(tmp_path):
+    path = tmp_path / "jobs.yaml"
+    path.write_text(yaml.safe_dump(HEADER))
+
+    with pytest.raises(ValueError, match="No jobs found"):
+        load_manifest(path)
+
+
+def test_unsupported_file_type(tmp_path):
+    with pytest.raises(ValueError, match=r"File type .txt.gz not supported"):
+        load_manifest(tmp_path / "jobs.txt.gz")
@@ -0,0 +1,96 @@
+from typing import Any, Iterable, List
+
+import pytest
+from fsspec import filesystem
+
+from fishsense_common.scheduling.job_definition import JobDefinition
+from fishsense_common.scheduling.journal import Journal
+from fishsense_common.scheduling.ray_job import RayJob
+
+
+def test_segments_are_merged_on_load(tmp_path):
+    fs = filesystem("file")
+    path = str(tmp_path / "journal")
+
+    first = Journal(fs, path)
+    first.record("a", 1)
+    first.flush()
+
+    second = Journal(fs, path)
+    second.record("b", 2)
+    second.record("a", 3)
+    second.flush()
+
+    # A segment cut short when the job died.
+    fs.pipe_file(f"{path}/99999999999999999999-0.journal", b"\x80\x05\x95")
+
+    assert Journal(fs, path).load() == {"a": 3, "b": 2}
+    assert len(fs.ls(path)) == 1
+    assert Journal(fs, path).load() == {"a": 3, "b": 2}
+
+
+def test_record_flushes_every_flush_items(tmp_path):
+    fs = filesystem("file")
+    path = str(tmp_path / "journal")
+
+    journal = Journal(fs, path, flush_items=2)
+    journal.record("a", 1)
+    assert Journal(fs, path).load() == {}
+
+    journal.record("b", 2)
+    assert Journal(fs, path).load() == {"a": 1, "b": 2}
+
+
+class SquareJob(RayJob):
+    name = "square"
+
+    def __init__(self, checkpoint: str, fail_at: int = None):
+        self.calls: List[int] = []
+        self.results: List[Any] = []
+        self.__fail_at = fail_at
+
+        super().__init__(
+            JobDefinition(
+                "Square",
+                self.name,
+                {"backend": "serial", "checkpoint": checkpoint},
+            ),
+            None,
+            None,
+            self.__square,
+        )
+
+    def __square(self, x: int) -> int:
+        self.calls.append(x)
+        if x == self.__fail_at:
+            raise RuntimeError(f"failed at {x}")
+
+        return x * x
+
+    @property
+    def job_count(self) -> int:
+        return 6
+
+    def item_key(self, parameters: Iterable[Any]) -> str:
+        return str(parameters[0])
+
+    def prologue(self) -> Iterable[Iterable[Any]]:
+        return ((x,) for x in range(self.job_count))
+
+    def epilogue(self, results: Iterable[Any]) -> None:
+        self.results.extend(results)
+
+
+def test_resume_skips_completed_items(tmp_path):
+    checkpoint = str(tmp_path / "journal")
+
+    failed = SquareJob(checkpoint, fail_at=3)
+    with pytest.raises(RuntimeError):
+        failed()
+    assert failed.calls == [0, 1, 2, 3]
+
+    resumed = SquareJob(checkpoint)
+    resumed()
+
+    assert resumed.calls == [3, 4, 5]
+    assert resumed.results == [x * x for x in range(6)]
@@ -0,0 +1,97 @@
+import weakref
+from typing import List
+
+from fishsense_common.pipeline.decorators import task
+from fishsense_common.pipeline.liveness import LiveSetReport, build_release_points
+from fishsense_common.pipeline.pipeline import Pipeline
+from fishsense_common.pipeline.plan import compile_task
+
+
+class Blob:
+    def __init__(self, nbytes: int):
+        # Read by sizeof, as for a NumPy array.
+        self.nbytes = nbytes
+
+
+images: List[weakref.ref] = []
+
+
+@task(output_name="image")
+def load(path: str) -> Blob:
+    image = Blob(10_000)
+    images.append(weakref.ref(image))
+    return image
+
+
+@task(output_name="box")
+def detect(image: Blob) -> Blob:
+    return Blob(10)
+
+
+@task(output_name="patch")
+def crop(image: Blob, box: Blob) -> Blob:
+    return Blob(1_000)
+
+
+@task(output_name="length")
+def measure(patch: Blob) -> float:
+    # The image is not read after crop, so it is gone by now.
+    assert images[-1]() is None
+    return patch.nbytes / 10
+
+
+@task(output_name="image")
+def normalize(image: Blob) -> Blob:
+    return Blob(image.nbytes)
+
+
+TASKS = (load, detect, crop, measure)
+
+
+def test_intermediates_are_released_after_their_last_reader():
+    plan = tuple(compile_task(t) for t in TASKS)
+
+    assert build_release_points(plan, ("length",)) == (
+        ("path",),
+        (),
+        ("box", "image"),
+        ("patch",),
+    )
+
+
+def test_return_names_are_kept():
+    plan = tuple(compile_task(t) for t in TASKS)
+
+    assert build_release_points(plan, ("box", "length")) == (
+        ("path",),
+        (),
+        ("image",),
+        ("patch",),
+    )
+
+
+def test_rebound_names_are_kept_until_rebound():
+    plan = tuple(compile_task(t) for t in (load, normalize, detect))
+
+    # normalize reads the image and binds it again, which detect then reads.
+    assert build_release_points(plan, ("box",)) == (("path",), (), ("image",))
+    assert build_release_points(plan, ("image", "box")) == (("path",), (), ())
+
+
+def test_live_set_report():
+    pipeline = Pipeline(*TASKS, return_name="length", track_live_set=True)
+
+    assert pipeline(path="fish.jpg") == ("SUCCESS", 100.0)
+
+    report = pipeline.live_set_report
+    assert isinstance(report, LiveSetReport)
+    assert report.peak_task == "crop"
+    assert report.peak_names == ("image", "box", "patch")
+    assert report.peak_bytes == 11_010
+
+
+def test_live_set_is_not_tracked_by_default():
+    pipeline = Pipeline(*TASKS, return_name="length")
+
+    assert pipeline(path="fish.jpg") == ("SUCCESS", 100.0)
+    assert pipeline.live_set_report is None
@@ -0,0 +1,181 @@
+import asyncio
+from typing import List
+
+import pytest
+
+from fishsense_common.pipeline.decorators import task
+from fishsense_common.pipeline.pipeline import Pipeline
+from fishsense_common.pipeline.status import Status, error, ok
+from fishsense_common.pipeline.streaming import StreamingPipeline
+
+
+@task(output_name="doubled", batched=True)
+def double_all(x: List[int]) -> List[Status]:
+    return [error(f"{v} is negative") if v < 0 else ok(v * 2) for v in x]
+
+
+def create_sink_pipeline(written: List[int]) -> Pipeline:
+    @task(batched=True)
+    def write_all(doubled: List[int]):
+        written.extend(doubled)
+
+    return Pipeline(double_all, write_all, return_name="doubled")
+
+
+def test_batched_sink_called_once_per_item():
+    written: List[int] = []
+    pipeline = create_sink_pipeline(written)
+
+    assert pipeline(x=2) == ("SUCCESS", 4)
+    assert pipeline(x=-1) == ("-1 is negative", None)
+    assert written == [4]
+
+
+def test_batched_sink_batch():
+    written: List[int] = []
+    pipeline = create_sink_pipeline(written)
+
+    assert pipeline.batch(x=[1, -1, 3]) == [
+        ("SUCCESS", 2),
+        ("-1 is negative", None),
+        ("SUCCESS", 6),
+    ]
+    # Failed items are dropped before the sink.
+    assert written == [2, 6]
+
+
+def test_batched_sink_map():
+    written: List[int] = []
+    pipeline = create_sink_pipeline(written)
+
+    results = list(pipeline.map(({"x": v} for v in range(5)), batch_size=2))
+
+    assert results == [("SUCCESS", v * 2) for v in range(5)]
+    assert written == [v * 2 for v in range(5)]
+
+
+@task(output_name="total")
+def add(a: int, b: int) -> int:
+    return a + b
+
+
+@task(output_name=("low", "high"))
+def split(total: int):
+    return total // 2, total - total // 2
+
+
+@task(output_name="ratio", returns_status=True)
+def divide(low: int, high: int) -> Status:
+    if high == 0:
+        return error("high is zero")
+
+    return ok(low / high)
+
+
+@task(output_name="scaled")
+def scale(ratio: float, factor: int):
+    # Not annotated, so the pipeline has to look for a Status at runtime.
+    if factor < 0:
+        return error("factor is negative")
+
+    return ratio * factor
+
+
+@task(output_name="total")
+async def add_later(a: int, b: int) -> int:
+    await asyncio.sleep(0)
+    return a + b
+
+
+@task(output_name="scaled")
+async def scale_later(ratio: float, factor: int):
+    await asyncio.sleep(0)
+    return await asyncio.to_thread(scale, ratio, factor)
+
+
+TASKS = (add, split, divide, scale)
+ASYNC_TASKS = (add_later, split, divide, scale_later)
+RETURN_NAME = ("scaled", "total")
+GRID = {"a": [0, 1, 4], "b": [0, 3], "factor": [-1, 10]}
+
+
+def expected(a: int, b: int, factor: int):
+    total = a + b
+    low, high = total // 2, total - total // 2
+    if high == 0:
+        return "high is zero", (None, None)
+
+    if factor < 0:
+        return "factor is negative", (None, None)
+
+    return "SUCCESS", (low / high * factor, total)
+
+
+def grid_points():
+    return [
+        {"a": a, "b": b, "factor": factor}
+        for a in GRID["a"]
+        for b in GRID["b"]
+        for factor in GRID["factor"]
+    ]
+
+
+@pytest.mark.parametrize("tasks", [TASKS, ASYNC_TASKS], ids=["sync", "async"])
+def test_pipeline_modes_agree(tasks):
+    points = grid_points()
+    expected_results = [expected(**p) for p in points]
+
+    sequential = Pipeline(*tasks, return_name=RETURN_NAME)
+    parallel = Pipeline(*tasks, return_name=RETURN_NAME, parallel=True)
+
+    assert [sequential(**p) for p in points] == expected_results
+    assert [parallel(**p) for p in points] == expected_results
+    assert [asyncio.run(sequential.acall(**p)) for p in points] == expected_results
+
+    assert (
+        sequential.batch(**{n: [p[n] for p in points] for n in GRID})
+        == expected_results
+    )
+    assert list(sequential.map(points, batch_size=4)) == expected_results
+    assert sequential.sweep({}, GRID) == list(zip(points, expected_results))
+
+    streaming = StreamingPipeline(*tasks, return_name=RETURN_NAME, queue_size=2)
+    assert list(streaming(points)) == expected_results
+
+
+def test_batched_tasks_cannot_be_async():
+    @task(output_name="doubled", batched=True)
+    async def double_later(x: List[int]) -> List[int]:
+        return [v * 2 for v in x]
+
+    with pytest.raises(ValueError, match="double_later cannot be async"):
+        Pipeline(double_later)
+
+
+def test_sweep_runs_each_task_once_per_distinct_input():
+    calls: List[str] = []
+
+    @task(output_name="total")
+    def count_add(a: int, b: int) -> int:
+        calls.append(f"add {a} {b}")
+        return add(a, b)
+
+    @task(output_name="scaled")
+    def count_scale(ratio: float, factor: int):
+        calls.append(f"scale {ratio} {factor}")
+        return scale(ratio, factor)
+
+    pipeline = Pipeline(count_add, split, divide, count_scale, return_name="scaled")
+    grid = {"a": [1, 2], "factor": [2, 3, 4]}
+    results = pipeline.sweep({"b": 5}, grid)
+
+    assert [r for _, r in results] == [
+        ("SUCCESS", expected(a, 5, factor)[1][0])
+        for a in grid["a"]
+        for factor in grid["factor"]
+    ]
+
+    # add only depends on a, while scale depends on every grid value.
+    assert sorted(c for c in calls if c.startswith("add")) == ["add 1 5", "add 2 5"]
+    assert len([c for c in calls if c.startswith("scale")]) == 6
+    assert len(set(calls)) == len(calls)
@@ -0,0 +1,74 @@
+import sys
+from pathlib import Path
+
+import pytest
+import ray
+
+from fishsense_common.pipeline.decorators import task
+from fishsense_common.pipeline.instrumentation import PipelineStats
+from fishsense_common.pipeline.pipeline import Pipeline
+from fishsense_common.pipeline.ray_pipeline import RayPipeline
+from fishsense_common.pipeline.status import error, ok
+
+
+@pytest.fixture(scope="module", autouse=True)
+def ray_runtime():
+    # Workers cannot import this module, so its tasks are sent along with them.
+    ray.cloudpickle.register_pickle_by_value(sys.modules[__name__])
+    ray.init(num_cpus=2, include_dashboard=False, log_to_driver=False)
+    yield
+    ray.shutdown()
+
+
+@task(output_name="checked", returns_status=True)
+def check(x: int):
+    return error(f"{x} is negative") if x < 0 else ok(x)
+
+
+@task(output_name="squared")
+def square(checked: int) -> int:
+    return checked * checked
+
+
+def create_marker_task(directory: Path):
+    # Workers are other processes, so side effects are observed through files.
+    @task()
+    def mark(x: int):
+        (directory / str(x)).touch()
+
+    return mark
+
+
+def test_matches_pipeline():
+    tasks = (check, square)
+
+    for x in (-2, 0, 3):
+        assert RayPipeline(*tasks, return_name="squared")(x=x) == Pipeline(
+            *tasks, return_name="squared"
+        )(x=x)
+
+
+def test_no_task_runs_after_a_failure(tmp_path: Path):
+    # mark does not read what check returns, but runs after it.
+    pipeline = RayPipeline(check, create_marker_task(tmp_path), square)
+
+    references = [pipeline.remote(x=x) for x in (-1, 2)]
+
+    assert ray.get(references) == [("-1 is negative", None), None]
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["2"]
+
+
+def test_stats_are_merged_on_the_driver():
+    stats = PipelineStats()
+    pipeline = RayPipeline(check, square, return_name="squared", stats=stats)
+
+    assert pipeline(x=2) == ("SUCCESS", 4)
+    assert stats.tasks["check"].calls == 1
+
+    references = [pipeline.remote(x=x) for x in (-1, 3)]
+    ray.get(references)
+
+    assert pipeline.stats is stats
+    assert stats.tasks["check"].calls == 3
+    assert stats.tasks["check"].failures == 1
+    assert stats.tasks["square"].calls == 2
@@ -0,0 +1,52 @@
+import fsspec
+import pytest
+
+from fishsense_common.scheduling.result_sink import ResultSink
+
+
+class FailingFilesystem:
+    def __init__(self):
+        self.pipes = 0
+
+    def makedirs(self, path: str, exist_ok: bool = False):
+        pass
+
+    def pipe(self, writes):
+        self.pipes += 1
+        raise OSError("disk full")
+
+    def put(self, local_paths, paths):
+        raise OSError("disk full")
+
+
+def test_results_are_written(tmp_path):
+    filesystem = fsspec.filesystem("file")
+
+    with ResultSink(filesystem, batch_size=2) as sink:
+        for i in range(5):
+            sink.write(f"{tmp_path}/results/{i}.txt", str(i).encode())
+
+    assert sink.written == 5
+    assert sorted(p.name for p in (tmp_path / "results").iterdir()) == [
+        f"{i}.txt" for i in range(5)
+    ]
+
+
+def test_a_failed_flush_fails_every_later_call():
+    filesystem = FailingFilesystem()
+    sink = ResultSink(filesystem, batch_size=1)
+
+    sink.write("results/0.txt", b"0")
+
+    # close waits for the flush, which raises from then on.
+    for _ in range(2):
+        with pytest.raises(OSError, match="disk full"):
+            sink.close()
+
+    for _ in range(2):
+        with pytest.raises(OSError, match="disk full"):
+            sink.write("results/1.txt", b"1")
+
+    # Nothing is flushed after the failure.
+    assert filesystem.pipes == 1
+    assert sink.written == 0
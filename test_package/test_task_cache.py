@@ -0,0 +1,119 @@
+from typing import Any, Callable, List
+
+import fsspec
+import pytest
+
+from fishsense_common.pipeline.cache import CachePolicy, TaskCache
+from fishsense_common.pipeline.decorators import task
+from fishsense_common.pipeline.pipeline import Pipeline
+from fishsense_common.pipeline.status import error, ok
+
+# Tasks are defined from source, so that a test can change a task's code as an edit
+# would, keeping its name.
+SOURCE = """
+def shift(x, logger):
+    calls.append(x)
+    if x < 0:
+        return error("x is negative")
+
+    return ok(x + {offset})
+"""
+
+
+def define(calls: List[int], offset: int = 1, **policy: Any) -> Callable:
+    namespace = {"__name__": __name__, "calls": calls, "error": error, "ok": ok}
+    exec(SOURCE.format(offset=offset), namespace)  # pylint: disable=exec-used
+
+    return task(output_name="shifted", cache=CachePolicy(**policy))(namespace["shift"])
+
+
+@pytest.fixture
+def filesystem():
+    filesystem = fsspec.filesystem("memory")
+    yield filesystem
+    filesystem.store.clear()
+
+
+def run(shift: Callable, cache: TaskCache, x: int, logger: str = "log"):
+    return Pipeline(shift, return_name="shifted", cache=cache)(x=x, logger=logger)
+
+
+def test_results_are_reused_across_pipelines(filesystem):
+    calls: List[int] = []
+    shift = define(calls)
+
+    first = TaskCache(filesystem, "/tasks")
+    assert run(shift, first, 1) == ("SUCCESS", 2)
+    assert (first.hits, first.misses) == (0, 1)
+
+    # A new cache on the same store, as in another process.
+    second = TaskCache(filesystem, "/tasks")
+    assert run(shift, second, 1) == ("SUCCESS", 2)
+    assert (second.hits, second.misses) == (1, 0)
+
+    assert calls == [1]
+
+
+def test_key_changes_with_inputs_and_code(filesystem):
+    calls: List[int] = []
+    cache = TaskCache(filesystem, "/tasks")
+
+    assert run(define(calls), cache, 1) == ("SUCCESS", 2)
+    assert run(define(calls), cache, 2) == ("SUCCESS", 3)
+    assert run(define(calls, offset=10), cache, 1) == ("SUCCESS", 11)
+    assert run(define(calls), cache, 1) == ("SUCCESS", 2)
+
+    assert calls == [1, 2, 1]
+
+
+def test_cache_policy(filesystem):
+    calls: List[int] = []
+    cache = TaskCache(filesystem, "/tasks")
+    shift = define(calls, ignore=("logger",))
+
+    # Ignored parameters do not change the key.
+    assert run(shift, cache, 1, logger="first") == ("SUCCESS", 2)
+    assert run(shift, cache, 1, logger="second") == ("SUCCESS", 2)
+    assert calls == [1]
+
+    # A new version invalidates the results of the old one.
+    assert run(define(calls, ignore=("logger",), version="2"), cache, 1) == (
+        "SUCCESS",
+        2,
+    )
+    assert calls == [1, 1]
+
+    # Without ignore, the logger is part of the key.
+    shift = define(calls)
+    assert run(shift, cache, 1, logger="first") == ("SUCCESS", 2)
+    assert run(shift, cache, 1, logger="second") == ("SUCCESS", 2)
+    assert calls == [1, 1, 1, 1]
+
+
+def test_failures_are_not_cached(filesystem):
+    calls: List[int] = []
+    cache = TaskCache(filesystem, "/tasks")
+    shift = define(calls)
+
+    for _ in range(2):
+        assert run(shift, cache, -1) == ("x is negative", None)
+
+    assert calls == [-1, -1]
+    assert not filesystem.find("/tasks")
+
+
+def test_least_recently_used_results_are_evicted(filesystem):
+    cache = TaskCache(filesystem, "/tasks", max_size_bytes=250)
+    value = b"x" * 100
+
+    cache.put("a" * 64, value)
+    cache.put("b" * 64, value)
+    assert cache.get("a" * 64) == (True, value)
+
+    # Three results do not fit, so b, which was used longest ago, goes.
+    cache.put("c" * 64, value)
+
+    assert cache.evictions == 1
+    assert cache.get("b" * 64) == (False, None)
+    assert cache.get("a" * 64) == (True, value)
+    assert cache.get("c" * 64) == (True, value)